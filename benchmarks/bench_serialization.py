@@ -0,0 +1,76 @@
+"""
+Compare the default FastAPI response path against `FastJSONResponse`
+for a page of tracks.
+
+Run from the repo root:
+    python -m benchmarks.bench_serialization
+"""
+import os
+import json
+import timeit
+
+# config.py exits when the essentials are missing, dummy values are enough here
+os.environ.setdefault("ENV", "bench")
+for key, value in {
+    "APP_ID": "1", "ADMINS": "1", "MUSIC_CHANNELS": "1",
+    "DATABASE_URL": "mongodb://localhost", "DATABASE_NAME": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from bot.database.models import DBTrack
+from bot.utils.web import dump_json
+
+
+PAGE_SIZE = 500
+ROUNDS = 50
+
+
+def make_page() -> List[DBTrack]:
+    now = datetime.utcnow()
+    return [
+        DBTrack(
+            _id=ObjectId(), chat_id=-1001234567890, msg_id=i,
+            file_unique_id=f"AgADxxxxxxxxxx{i}", file_size=8_000_000 + i,
+            file_name=f"track_{i}.flac", title=f"Track number {i}", track_id=str(1_000_000 + i),
+            artist="Some Artist", artist_id="123456", album="Some Album", album_id="654321",
+            isrc=f"USABC2400{i:03d}", track_no=i % 20, provider="apple-music",
+            duration=215_000, tags=["Pop", "Music"], mime_type="audio/flac",
+            cover_url="https://is1-ssl.mzstatic.com/image/thumb/1200x1200bb.jpg",
+            created_at=now, updated_at=now
+        )
+        for i in range(PAGE_SIZE)
+    ]
+
+
+def fastapi_default(adapter: TypeAdapter, page: List[DBTrack]) -> bytes:
+    # what FastAPI does with `response_model`: re-validate, dump to python, json.dumps
+    value = adapter.validate_python(page)
+    content = adapter.dump_python(value, mode="json", by_alias=True)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def main():
+    page = make_page()
+    adapter = TypeAdapter(List[DBTrack])
+
+    assert json.loads(fastapi_default(adapter, page)) == json.loads(dump_json(page))
+
+    default_time = timeit.timeit(lambda: fastapi_default(adapter, page), number=ROUNDS)
+    fast_time = timeit.timeit(lambda: dump_json(page), number=ROUNDS)
+
+    print(f"{PAGE_SIZE} tracks x {ROUNDS} rounds")
+    print(f"default response path : {default_time / ROUNDS * 1000:.2f} ms/page")
+    print(f"FastJSONResponse       : {fast_time / ROUNDS * 1000:.2f} ms/page")
+    print(f"speedup                : {default_time / fast_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
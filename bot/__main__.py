@@ -11,12 +11,17 @@ from uvicorn.config import LOGGING_CONFIG
 from config import Config
 from .tgclient import botmanager
 from .database.connection import mongo
+from .database.catalogue import catalogue
+from .database import TrackManager
 from .logger import LOGGER
 from .metadata.handler import meta_manager
+from .modules.indexing import resume_indexing
+from .modules.enrich import enricher
 from .server.routes import router
+from .utils.web import FastJSONResponse
 
 
-web_server = FastAPI(title="Shizuru Backend API")
+web_server = FastAPI(title="Shizuru Backend API", default_response_class=FastJSONResponse)
 web_server.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -54,6 +59,7 @@ async def run_fastapi():
 
 
 async def main():
+    indexing_task = None
     try:
         await botmanager.add_main_bot(Config.TG_BOT_TOKEN)
         if Config.MULTI_CLIENTS:
@@ -63,7 +69,13 @@ async def main():
         await botmanager.start_all()
         
         await mongo.connect()
+        await TrackManager.load_known()
+        if Config.CATALOGUE_CACHE:
+            await catalogue.start()
         await meta_manager.setup()
+        # tracks stored from tags or telegram metadata in earlier runs
+        enricher.start()
+        indexing_task = asyncio.create_task(resume_indexing(botmanager.get_main_bot().client))
 
         await run_fastapi()
 
@@ -74,6 +86,9 @@ async def main():
         
     finally:
         LOGGER.info("Stopping services...")
+        if indexing_task:
+            indexing_task.cancel()
+        await catalogue.stop()
         try:
             await meta_manager.stop()
         except Exception:
@@ -1,5 +1,8 @@
 from .artist import ArtistManager
 from .album import AlbumManager
 from .track import TrackManager
+from .summary import ArtistSummaryManager, artist_summaries
+from .trash import TrashManager
+from .jobs import JobManager
 
-__all__ = ["ArtistManager", "AlbumManager", "TrackManager"]
\ No newline at end of file
+__all__ = ["ArtistManager", "AlbumManager", "TrackManager", "ArtistSummaryManager", "artist_summaries", "TrashManager", "JobManager"]
\ No newline at end of file
@@ -0,0 +1,20 @@
+"""
+Apply database migrations and exit.
+    python -m bot.database
+"""
+import asyncio
+
+from .connection import mongo
+from .schema import migrate
+
+
+async def main():
+    await mongo.connect(check_schema=False)
+    try:
+        await migrate(mongo.db)
+    finally:
+        await mongo.disconnect()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,20 +1,32 @@
 from .models import BaseAlbum, DBAlbum
 from .connection import mongo, COLLECTIONS
+from .writer import album_writer
 
 class AlbumManager:
+    # album ids seen in the database, albums are never deleted so this only grows
+    known_ids = set()
 
     @staticmethod
     async def check_album_exists(album_id: str):
         """Searches the Database if Album already exists"""
+        if album_id in AlbumManager.known_ids:
+            return True
         document = await mongo.db[COLLECTIONS["albums"]].find_one(
-            {"album_id": album_id}
+            {"album_id": album_id}, {"_id": 1}
         )
+        if document:
+            AlbumManager.known_ids.add(album_id)
         return document is not None
 
     @staticmethod
-    async def insert_album(data: BaseAlbum):
+    async def insert_album(data: BaseAlbum) -> bool:
+        """Returns False if the album already existed"""
         album = DBAlbum(**data.dict())
-        await mongo.db[COLLECTIONS["albums"]].insert_one(album.dict(by_alias=True, exclude_unset=True))
+        document = album.dict(by_alias=True, exclude_unset=True)
+        document.update(created_at=album.created_at, updated_at=album.updated_at)
+        inserted = await album_writer.upsert(document)
+        AlbumManager.known_ids.add(album.album_id)
+        return inserted
 
 
 
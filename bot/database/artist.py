@@ -1,12 +1,17 @@
 from .models import BaseArtist, DBArtist
 from .connection import mongo, COLLECTIONS
+from .writer import artist_writer
 from bot.logger import LOGGER
 
 class ArtistManager:
+    # artist ids seen in the database, artists are never deleted so this only grows
+    known_ids = set()
 
     @staticmethod
     async def check_exists(artist_id: str, artist_name: str):
         """Searches the Database if Artist entry already exists"""
+        if artist_id in ArtistManager.known_ids:
+            return True
         document = None
         try:
             assert(artist_id)
@@ -18,12 +23,20 @@ class ArtistManager:
             document = await mongo.db[COLLECTIONS["artists"]].find_one(
                 {"name": artist_name}
             )
+        if document and artist_id:
+            ArtistManager.known_ids.add(artist_id)
         return document is not None
 
 
     @staticmethod
-    async def insert_artist(data: BaseArtist):
+    async def insert_artist(data: BaseArtist) -> bool:
+        """Returns False if the artist already existed"""
         artist = DBArtist(**data.dict())
-        await mongo.db[COLLECTIONS["artists"]].insert_one(artist.dict(by_alias=True, exclude_unset=True))
+        document = artist.dict(by_alias=True, exclude_unset=True)
+        document.update(created_at=artist.created_at, updated_at=artist.updated_at)
+        inserted = await artist_writer.upsert(document)
+        if artist.artist_id:
+            ArtistManager.known_ids.add(artist.artist_id)
+        return inserted
 
 
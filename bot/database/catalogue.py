@@ -0,0 +1,353 @@
+"""
+Optional in-process copy of the catalogue (songs, albums, artists).
+
+Tracks are kept as slotted records with repeated values (artist, album, ids,
+provider, mime type, cover url, tags, chat id) interned, so the per-track cost
+is mostly the strings that are unique to it (title, file name, file id,
+track id, isrc). Measured with tracemalloc on synthetic tracks with realistic
+field lengths (8k albums), 100k tracks take about 90 MB including the lookup
+dicts, so roughly 0.9 KB per track. Albums and artists are kept as models and
+are small next to that. `CATALOGUE_MAX_TRACKS` caps it, the catalogue turns
+itself off and reads go back to MongoDB if a library grows past that.
+
+The copy is kept in sync by polling `updated_at` on every collection and
+`moved_at` on trash (for removed tracks). Each poll looks back `COMMIT_LAG` so
+late commits are not missed, and song ids are reconciled every
+`RECONCILE_INTERVAL` to drop tracks deleted without going through trash.
+"""
+import re
+import sys
+import time
+import asyncio
+
+from bson import ObjectId
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+from .connection import mongo, COLLECTIONS
+from .models import DBAlbum, DBArtist, DBTrack
+from .writer import COMMIT_LAG
+from bot.logger import LOGGER
+
+
+TRACK_FIELDS = (
+    "chat_id", "msg_id", "file_unique_id", "file_size", "file_name",
+    "title", "track_id", "artist", "artist_id", "album", "album_id",
+    "isrc", "track_no", "provider", "duration", "tags", "mime_type", "cover_url",
+    "created_at", "updated_at"
+)
+
+RECONCILE_INTERVAL = 10 * 60  # seconds between full checks of which songs still exist
+
+# values shared by many tracks, only one copy of each is kept
+SHARED_FIELDS = (
+    "chat_id", "artist", "artist_id", "album", "album_id",
+    "provider", "tags", "mime_type", "cover_url"
+)
+
+
+class TrackRecord:
+    __slots__ = ("oid",) + TRACK_FIELDS
+
+    def to_model(self) -> DBTrack:
+        values = {name: getattr(self, name) for name in TRACK_FIELDS}
+        if values["tags"] is not None:
+            values["tags"] = list(values["tags"])
+        # let the model fill in timestamps missing from old documents
+        for name in ("created_at", "updated_at"):
+            if values[name] is None:
+                del values[name]
+        return DBTrack.model_construct(id=ObjectId(self.oid), **values)
+
+
+class Catalogue:
+    def __init__(self, max_tracks: int, sync_interval: float):
+        """
+        Args:
+            max_tracks: Give up on the in-memory copy above this many tracks
+            sync_interval: Seconds between polls for changed documents
+        """
+        self.max_tracks = max_tracks
+        self.sync_interval = sync_interval
+        self.ready = False
+
+        self._tracks: Dict[bytes, TrackRecord] = {}
+        self._by_track_id: Dict[str, TrackRecord] = {}
+        self._by_file_unique_id: Dict[str, TrackRecord] = {}
+        self._by_album: Dict[str, List[TrackRecord]] = {}
+        self._track_list: Optional[List[TrackRecord]] = None
+
+        # keyed by `_id` like the collections, with lookups by provider id
+        self._albums: Dict[ObjectId, DBAlbum] = {}
+        self._artists: Dict[ObjectId, DBArtist] = {}
+        self._by_album_id: Dict[str, DBAlbum] = {}
+        self._by_artist_id: Dict[str, DBArtist] = {}
+
+        self._shared: Dict[Any, Any] = {}
+        self._watermarks: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+
+    async def start(self):
+        """Load the catalogue in the background, reads use MongoDB until it is ready"""
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+    async def stop(self):
+        self.ready = False
+        if self._task:
+            self._task.cancel()
+
+
+    async def _run(self):
+        try:
+            if not await self._load():
+                return
+            self.ready = True
+            LOGGER.info(f"Catalogue : Loaded {len(self._tracks)} tracks, {len(self._albums)} albums, {len(self._artists)} artists")
+
+            reconciled_at = time.monotonic()
+            while True:
+                await asyncio.sleep(self.sync_interval)
+                try:
+                    await self._sync()
+                    if time.monotonic() - reconciled_at >= RECONCILE_INTERVAL:
+                        await self._reconcile()
+                        reconciled_at = time.monotonic()
+                except Exception as e:
+                    LOGGER.error(f"Catalogue : Sync failed - {e}")
+                if len(self._tracks) > self.max_tracks:
+                    self._disable(f"more than {self.max_tracks} tracks")
+                    return
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._disable(str(e))
+
+
+    def _disable(self, reason: str):
+        LOGGER.warning(f"Catalogue : Disabled ({reason}), serving reads from MongoDB")
+        self.ready = False
+        self._tracks.clear()
+        self._by_track_id.clear()
+        self._by_file_unique_id.clear()
+        self._by_album.clear()
+        self._albums.clear()
+        self._artists.clear()
+        self._by_album_id.clear()
+        self._by_artist_id.clear()
+        self._shared.clear()
+        self._track_list = None
+
+
+    async def _load(self) -> bool:
+        # take the watermarks first so nothing written during the load is missed
+        now = datetime.utcnow()
+        for name in ("songs", "albums", "artists", "trash"):
+            self._watermarks[name] = now
+
+        total = await mongo.db[COLLECTIONS["songs"]].estimated_document_count()
+        if total > self.max_tracks:
+            self._disable(f"more than {self.max_tracks} tracks")
+            return False
+
+        async for doc in mongo.db[COLLECTIONS["songs"]].find().sort("_id", 1):
+            self._put_track(doc)
+        async for doc in mongo.db[COLLECTIONS["albums"]].find():
+            self._put_album(doc)
+        async for doc in mongo.db[COLLECTIONS["artists"]].find():
+            self._put_artist(doc)
+        return True
+
+
+    async def _sync(self):
+        """Apply documents changed since the last poll, applying one twice is harmless"""
+        for name, put in (("songs", self._put_track), ("albums", self._put_album), ("artists", self._put_artist)):
+            watermark = self._watermarks[name]
+            cursor = mongo.db[COLLECTIONS[name]].find({"updated_at": {"$gte": watermark - COMMIT_LAG}}).sort("updated_at", 1)
+            async for doc in cursor:
+                put(doc)
+                watermark = max(watermark, doc["updated_at"])
+            self._watermarks[name] = watermark
+
+        watermark = self._watermarks["trash"]
+        cursor = mongo.db[COLLECTIONS["trash"]].find(
+            {"moved_at": {"$gte": watermark - COMMIT_LAG}, "status": "pending"},
+            {"original_song_data._id": 1, "moved_at": 1}
+        )
+        async for doc in cursor:
+            self._remove_track(doc["original_song_data"]["_id"])
+            watermark = max(watermark, doc["moved_at"])
+        self._watermarks["trash"] = watermark
+
+
+    async def _reconcile(self):
+        """Drop tracks whose song document is gone, deletes outside of trash leave no change to poll"""
+        existing = {doc["_id"].binary async for doc in mongo.db[COLLECTIONS["songs"]].find({}, {"_id": 1})}
+        for oid in [oid for oid in self._tracks if oid not in existing]:
+            self._remove_track(ObjectId(oid))
+
+
+    def _share(self, value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return sys.intern(value)
+        if isinstance(value, list):
+            value = tuple(value)
+        return self._shared.setdefault(value, value)
+
+
+    def _put_track(self, doc: dict):
+        oid = doc["_id"].binary
+        old = self._tracks.get(oid)
+        if old:
+            self._remove_track(doc["_id"])
+
+        record = TrackRecord()
+        record.oid = oid
+        for name in TRACK_FIELDS:
+            value = doc.get(name)
+            if name in SHARED_FIELDS:
+                value = self._share(value)
+            setattr(record, name, value)
+
+        self._tracks[oid] = record
+        if record.track_id:
+            self._by_track_id.setdefault(record.track_id, record)
+        if record.file_unique_id:
+            self._by_file_unique_id.setdefault(record.file_unique_id, record)
+        if record.album_id:
+            self._by_album.setdefault(record.album_id, []).append(record)
+        self._track_list = None
+
+
+    def _remove_track(self, _id: ObjectId):
+        record = self._tracks.pop(_id.binary, None)
+        if not record:
+            return
+        if self._by_track_id.get(record.track_id) is record:
+            del self._by_track_id[record.track_id]
+        if self._by_file_unique_id.get(record.file_unique_id) is record:
+            del self._by_file_unique_id[record.file_unique_id]
+        if record.album_id in self._by_album:
+            self._by_album[record.album_id] = [r for r in self._by_album[record.album_id] if r is not record]
+        self._track_list = None
+
+
+    def _put_album(self, doc: dict):
+        album = DBAlbum(**doc)
+        self._albums[album.id] = album
+        current = self._by_album_id.get(album.album_id)
+        if current is None or current.id == album.id:
+            self._by_album_id[album.album_id] = album
+
+
+    def _put_artist(self, doc: dict):
+        artist = DBArtist(**doc)
+        self._artists[artist.id] = artist
+        current = self._by_artist_id.get(artist.artist_id)
+        if artist.artist_id and (current is None or current.id == artist.id):
+            self._by_artist_id[artist.artist_id] = artist
+
+
+    @property
+    def track_list(self) -> List[TrackRecord]:
+        if self._track_list is None:
+            self._track_list = sorted(self._tracks.values(), key=lambda r: r.oid)
+        return self._track_list
+
+
+    # Reads, all mirror the MongoDB queries they replace
+
+    def get_songs(self, skip: int, limit: int) -> List[DBTrack]:
+        return [record.to_model() for record in self.track_list[skip:skip + limit]]
+
+    def get_song(self, track_id: str) -> Optional[DBTrack]:
+        record = self._by_track_id.get(track_id)
+        return record.to_model() if record else None
+
+    def get_song_by_file(self, file_unique_id: str) -> Optional[DBTrack]:
+        record = self._by_file_unique_id.get(file_unique_id)
+        return record.to_model() if record else None
+
+    def get_songs_batch(self, track_ids: List[str]) -> Tuple[List[DBTrack], List[str]]:
+        found = [self._by_track_id.get(_id) for _id in track_ids]
+        return (
+            [record.to_model() for record in found if record],
+            [_id for _id, record in zip(track_ids, found) if not record]
+        )
+
+    def iter_songs(self) -> Iterator[DBTrack]:
+        for record in self.track_list:
+            yield record.to_model()
+
+    def iter_albums(self) -> Iterator[DBAlbum]:
+        return iter(list(self._albums.values()))
+
+    def get_albums(self, skip: int, limit: int) -> List[DBAlbum]:
+        return list(self._albums.values())[skip:skip + limit]
+
+    def get_album(self, album_id: str) -> Optional[DBAlbum]:
+        return self._by_album_id.get(album_id)
+
+    def get_album_tracks(self, album_id: str) -> List[DBTrack]:
+        return [record.to_model() for record in self._by_album.get(album_id, [])]
+
+    def get_albums_batch(self, album_ids: List[str]) -> Tuple[List[DBAlbum], List[str]]:
+        return (
+            [self._by_album_id[_id] for _id in album_ids if _id in self._by_album_id],
+            [_id for _id in album_ids if _id not in self._by_album_id]
+        )
+
+    def iter_artists(self) -> Iterator[DBArtist]:
+        return iter(list(self._artists.values()))
+
+    def get_artists(self, skip: int, limit: int) -> List[DBArtist]:
+        return list(self._artists.values())[skip:skip + limit]
+
+    def get_artist(self, artist_id: str) -> Optional[DBArtist]:
+        return self._by_artist_id.get(artist_id)
+
+    def get_artist_albums(self, artist_id: str) -> List[DBAlbum]:
+        return [album for album in self._albums.values() if album.artist_id == artist_id]
+
+    def get_artists_batch(self, artist_ids: List[str]) -> Tuple[List[DBArtist], List[str]]:
+        return (
+            [self._by_artist_id[_id] for _id in artist_ids if _id in self._by_artist_id],
+            [_id for _id in artist_ids if _id not in self._by_artist_id]
+        )
+
+    def search_songs(self, regex: re.Pattern, skip: int, limit: int) -> List[DBTrack]:
+        matches = (
+            record for record in self.track_list
+            if any(value and regex.search(value) for value in (record.title, record.album, record.artist))
+        )
+        return [record.to_model() for record in _page(matches, skip, limit)]
+
+    def search_albums(self, regex: re.Pattern, skip: int, limit: int) -> List[DBAlbum]:
+        matches = (
+            album for album in self._albums.values()
+            if regex.search(album.title) or regex.search(album.artist)
+        )
+        return list(_page(matches, skip, limit))
+
+    def search_artists(self, regex: re.Pattern, skip: int, limit: int) -> List[DBArtist]:
+        matches = (artist for artist in self._artists.values() if regex.search(artist.name))
+        return list(_page(matches, skip, limit))
+
+
+def _page(items: Iterator, skip: int, limit: int) -> List:
+    page = []
+    for index, item in enumerate(items):
+        if index < skip:
+            continue
+        if len(page) >= limit:
+            break
+        page.append(item)
+    return page
+
+
+catalogue = Catalogue(Config.CATALOGUE_MAX_TRACKS, Config.CATALOGUE_SYNC_INTERVAL)
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Union
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from .models import DBBackfill, DBIndexJob
+from .connection import mongo, COLLECTIONS
+from .writer import job_deleter
+from config import Config
+
+
+RETRY_BASE = 30  # seconds, doubled on every attempt
+RETRY_MAX = 3600
+
+
+class JobManager:
+    """
+    Indexing work kept in MongoDB so a restart picks up where it stopped.
+    One job per message, deleted once the message is indexed.
+    """
+
+    @staticmethod
+    async def enqueue(chat_id: int, msg_ids: List[int]):
+        """Record messages about to be queued, already known ones are left alone"""
+        if not msg_ids:
+            return
+        now = datetime.utcnow()
+        await mongo.db[COLLECTIONS["index_jobs"]].bulk_write([
+            UpdateOne(
+                {"chat_id": chat_id, "msg_id": msg_id},
+                {"$setOnInsert": DBIndexJob(chat_id=chat_id, msg_id=msg_id, created_at=now, updated_at=now).dict(exclude={"id"})},
+                upsert=True
+            )
+            for msg_id in msg_ids
+        ], ordered=False)
+
+
+    @staticmethod
+    async def done(chat_id: int, msg_id: int):
+        """Indexed jobs are deleted in batches, a busy indexer settles hundreds per write"""
+        await job_deleter.delete({"chat_id": chat_id, "msg_id": msg_id})
+
+
+    @staticmethod
+    async def failed(chat_id: int, msg_id: int, error: str):
+        """Schedule a retry with exponential backoff, give up after `INDEX_MAX_ATTEMPTS`"""
+        job = await mongo.db[COLLECTIONS["index_jobs"]].find_one_and_update(
+            {"chat_id": chat_id, "msg_id": msg_id},
+            {"$inc": {"attempts": 1}, "$set": {"error": error, "updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return
+
+        if job["attempts"] >= Config.INDEX_MAX_ATTEMPTS:
+            update = {"state": "failed", "next_attempt_at": None}
+        else:
+            delay = min(RETRY_BASE * 2 ** (job["attempts"] - 1), RETRY_MAX)
+            update = {"state": "retry", "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)}
+        await mongo.db[COLLECTIONS["index_jobs"]].update_one({"_id": job["_id"]}, {"$set": update})
+
+
+    @staticmethod
+    async def get_queued() -> List[DBIndexJob]:
+        """Jobs that were queued or running when the process stopped"""
+        cursor = mongo.db[COLLECTIONS["index_jobs"]].find({"state": "queued"}).sort([("chat_id", 1), ("msg_id", 1)])
+        return [DBIndexJob(**job) async for job in cursor]
+
+
+    @staticmethod
+    async def claim_due(limit: int = 500) -> List[DBIndexJob]:
+        """Move retries whose backoff is over back to queued and return them"""
+        cursor = mongo.db[COLLECTIONS["index_jobs"]].find(
+            {"state": "retry", "next_attempt_at": {"$lte": datetime.utcnow()}}
+        ).limit(limit)
+        jobs = [DBIndexJob(**job) async for job in cursor]
+        if jobs:
+            await mongo.db[COLLECTIONS["index_jobs"]].update_many(
+                {"_id": {"$in": [job.id for job in jobs]}, "state": "retry"},
+                {"$set": {"state": "queued", "updated_at": datetime.utcnow()}}
+            )
+        return jobs
+
+
+    @staticmethod
+    async def count_by_state() -> Dict[str, int]:
+        cursor = mongo.db[COLLECTIONS["index_jobs"]].aggregate([
+            {"$group": {"_id": "$state", "count": {"$sum": 1}}}
+        ])
+        return {doc["_id"]: doc["count"] async for doc in cursor}
+
+
+    # Range backfills (/index), the position is saved after every chunk
+
+    @staticmethod
+    async def create_backfill(chat_id: Union[int, str], start_msg_id: int, end_msg_id: int) -> DBBackfill:
+        backfill = DBBackfill(
+            chat_id=chat_id,
+            start_msg_id=start_msg_id,
+            end_msg_id=end_msg_id,
+            position=start_msg_id
+        )
+        result = await mongo.db[COLLECTIONS["index_backfills"]].insert_one(backfill.dict(exclude={"id"}))
+        backfill.id = result.inserted_id
+        return backfill
+
+
+    @staticmethod
+    async def checkpoint(backfill_id: ObjectId, position: int, queued: int):
+        await mongo.db[COLLECTIONS["index_backfills"]].update_one(
+            {"_id": backfill_id},
+            {"$set": {"position": position, "queued": queued, "updated_at": datetime.utcnow()}}
+        )
+
+
+    @staticmethod
+    async def finish_backfill(backfill_id: ObjectId):
+        await mongo.db[COLLECTIONS["index_backfills"]].delete_one({"_id": backfill_id})
+
+
+    @staticmethod
+    async def get_backfills() -> List[DBBackfill]:
+        cursor = mongo.db[COLLECTIONS["index_backfills"]].find().sort("created_at", 1)
+        return [DBBackfill(**backfill) async for backfill in cursor]
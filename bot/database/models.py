@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Union
 from bson import ObjectId
 from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import core_schema
@@ -37,8 +38,9 @@ class PyObjectId(ObjectId):
                     core_schema.str_schema(),
                 ]),
             ),
+            # builtin `str` is called straight from pydantic-core without a python frame
             serialization=core_schema.plain_serializer_function_ser_schema(
-                lambda x: str(x)
+                str, return_schema=core_schema.str_schema()
             ),
         )
 
@@ -79,6 +81,15 @@ class DBTrack(MongoBaseModel, BaseTrack):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class DBArtistSummary(MongoBaseModel):
+    artist_id: str
+    popular: List[DBTrack] = []  # most played
+    recent: List[DBTrack] = []  # latest indexed
+    shuffled: List[DBTrack] = []  # stable random pick, only changes when tracks change
+    track_count: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class DBUser(MongoBaseModel):
     username: str
     email: Optional[str] = None
@@ -101,9 +112,32 @@ class DBPlaylist(MongoBaseModel):
     user_id: PyObjectId  # reference to User
     song_ids: List[PyObjectId] = []  # references to Song
     is_public: bool = False
+    track_count: int = 0  # kept in sync with song_ids
+    duration: int = 0  # total duration in ms
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class DBIndexJob(MongoBaseModel):
+    chat_id: int
+    msg_id: int
+    state: str = "queued"  # queued, retry, failed (done jobs are deleted)
+    attempts: int = 0
+    error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DBBackfill(MongoBaseModel):
+    chat_id: Union[int, str]
+    start_msg_id: int
+    end_msg_id: int
+    position: int  # next message id to fetch
+    queued: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 # Specially for file not found
 class DBTrash(MongoBaseModel):
     original_song_data: dict  # Store original song document incase of restoring or edits
@@ -112,4 +146,4 @@ class DBTrash(MongoBaseModel):
     reason: str
     moved_at: datetime = Field(default_factory=datetime.utcnow)
     verified_by_admin: Optional[PyObjectId] = None  # reference to User (admin)
-    status: str = "pending"  # pending, restored etc.....
\ No newline at end of file
+    status: str = "pending"  # pending, restored, reindexed
\ No newline at end of file
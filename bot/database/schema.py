@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from .connection import COLLECTIONS
+from ..logger import LOGGER
+
+
+# Every index the app relies on. Edit this list instead of creating indexes elsewhere,
+# the next migration picks up the difference.
+INDEXES: Dict[str, List[IndexModel]] = {
+    COLLECTIONS['songs']: [
+        IndexModel([("chat_id", 1), ("msg_id", 1)], unique=True),
+        IndexModel([("track_id", 1), ("provider", 1)], sparse=True),
+        IndexModel([("artist_id", 1), ("provider", 1)], sparse=True),
+        IndexModel([("album_id", 1), ("provider", 1)], sparse=True),
+        IndexModel([("artist", 1)]),
+        IndexModel([("file_unique_id", 1)]),
+        IndexModel([("artist_id", 1), ("created_at", -1)]),
+        IndexModel([("artist_id", 1), ("play_count", -1)]),
+        IndexModel([("updated_at", 1), ("_id", 1)]),
+        # re-enrichment scan of tracks without provider metadata
+        IndexModel([("provider", 1), ("_id", 1)]),
+        #IndexModel([("title", "text"), ("artist", "text"), ("album", "text")]),
+    ],
+    COLLECTIONS['artists']: [
+        IndexModel([("artist_id", 1), ("provider", 1)], unique=True),
+        #IndexModel([("name", "text")]),
+        IndexModel([("name", 1)]),
+        IndexModel([("tags", 1)], sparse=True),
+        IndexModel([("updated_at", 1), ("_id", 1)]),
+    ],
+    COLLECTIONS['artist_summaries']: [
+        IndexModel([("artist_id", 1)], unique=True),
+    ],
+    COLLECTIONS['albums']: [
+        IndexModel([("album_id", 1), ("provider", 1)], unique=True),
+        IndexModel([("artist_id", 1), ("provider", 1)]),
+        IndexModel([("title", 1)]),
+        IndexModel([("updated_at", 1), ("_id", 1)]),
+        #IndexModel([("title", "text"), ("artist", "text")]),
+    ],
+    COLLECTIONS['users']: [
+        IndexModel([("username", 1)], unique=True),
+        IndexModel([("email", 1)], unique=True, sparse=True),
+        IndexModel([("is_admin", 1)]),
+    ],
+    COLLECTIONS['liked_songs']: [
+        IndexModel([("user_id", 1), ("song_id", 1)], unique=True),
+        IndexModel([("song_id", 1)]),
+        IndexModel([("user_id", 1), ("created_at", -1)]),
+    ],
+    COLLECTIONS['playlists']: [
+        IndexModel([("user_id", 1)]),
+        IndexModel([("user_id", 1), ("name", 1)]),
+        IndexModel([("user_id", 1), ("created_at", -1)]),
+        #IndexModel([("name", "text")]),
+    ],
+    COLLECTIONS['index_jobs']: [
+        IndexModel([("chat_id", 1), ("msg_id", 1)], unique=True),
+        IndexModel([("state", 1), ("next_attempt_at", 1)]),
+    ],
+    COLLECTIONS['metadata_cache']: [
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+    ],
+    COLLECTIONS['trash']: [
+        IndexModel([("chat_id", 1), ("msg_id", 1)]),
+        IndexModel([("status", 1)]),
+        IndexModel([("moved_at", -1)]),
+        IndexModel([("moved_at", 1), ("_id", 1)]),
+        IndexModel([("verified_by_admin", 1)], sparse=True),
+        IndexModel([("reason", 1)]),
+    ],
+}
+
+
+async def _backfill_timestamps(db: AsyncIOMotorDatabase) -> None:
+    """Older inserts never stored created_at / updated_at, derive them from the ObjectId"""
+    for collection in (COLLECTIONS['songs'], COLLECTIONS['albums'], COLLECTIONS['artists']):
+        await db[collection].update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {
+                "created_at": {"$ifNull": ["$created_at", {"$toDate": "$_id"}]},
+                "updated_at": {"$toDate": "$_id"}
+            }}]
+        )
+
+
+async def _backfill_playlist_durations(db: AsyncIOMotorDatabase) -> None:
+    """Playlists keep the duration of every entry next to song_ids, derive it for older ones"""
+    async for playlist in db[COLLECTIONS['playlists']].find({"song_durations": {"$exists": False}}, {"song_ids": 1}):
+        song_ids = playlist.get("song_ids") or []
+        cursor = db[COLLECTIONS['songs']].find({"_id": {"$in": song_ids}}, {"duration": 1})
+        found = {song["_id"]: song.get("duration") or 0 async for song in cursor}
+        durations = [found.get(song_id, 0) for song_id in song_ids]
+        await db[COLLECTIONS['playlists']].update_one(
+            {"_id": playlist["_id"], "song_ids": song_ids},
+            {"$set": {"song_durations": durations, "track_count": len(song_ids), "duration": sum(durations)}}
+        )
+
+
+# One-off data migrations, each runs once and in this order
+MIGRATIONS: List[Tuple[str, Callable[[AsyncIOMotorDatabase], Awaitable[None]]]] = [
+    ("backfill_timestamps", _backfill_timestamps),
+    ("backfill_playlist_durations", _backfill_playlist_durations),
+]
+
+
+def _signature(collection: str, index: IndexModel) -> str:
+    """Stable description of an index, changes whenever its keys or options change"""
+    document = dict(index.document)
+    document["key"] = list(document["key"].items())
+    document["collection"] = collection
+    return json.dumps(document, sort_keys=True, default=str)
+
+
+def _wanted_indexes() -> Dict[str, Tuple[str, IndexModel]]:
+    return {
+        _signature(collection, index): (collection, index)
+        for collection, indexes in INDEXES.items()
+        for index in indexes
+    }
+
+
+SCHEMA_VERSION = hashlib.sha1(
+    "\n".join(sorted(_wanted_indexes()) + [name for name, _ in MIGRATIONS]).encode()
+).hexdigest()[:12]
+
+
+async def get_applied_schema(db: AsyncIOMotorDatabase) -> dict:
+    return await db[COLLECTIONS['meta']].find_one({"_id": "schema"}) or {}
+
+
+async def migrate(db: AsyncIOMotorDatabase) -> None:
+    """
+    Bring the indexes in line with `INDEXES` and run pending `MIGRATIONS`,
+    touching only what changed since the last run
+    """
+    applied = await get_applied_schema(db)
+    recorded = {item["signature"]: item for item in applied.get("indexes", [])}
+    wanted = _wanted_indexes()
+
+    stale = [item for signature, item in recorded.items() if signature not in wanted]
+    missing: Dict[str, List[IndexModel]] = {}
+    for signature, (collection, index) in wanted.items():
+        if signature not in recorded:
+            missing.setdefault(collection, []).append(index)
+
+    async def drop(item: dict):
+        try:
+            await db[item["collection"]].drop_index(item["name"])
+        except OperationFailure as e:
+            LOGGER.warning(f"Schema : Could not drop index {item['name']} - {e}")
+
+    # drop first, a changed index usually keeps its name
+    await asyncio.gather(*(drop(item) for item in stale))
+    await asyncio.gather(*(
+        db[collection].create_indexes(indexes) for collection, indexes in missing.items()
+    ))
+
+    done = applied.get("migrations", [])
+    for name, func in MIGRATIONS:
+        if name not in done:
+            await func(db)
+            done.append(name)
+            LOGGER.info(f"Schema : Applied migration {name}")
+
+    await db[COLLECTIONS['meta']].replace_one(
+        {"_id": "schema"},
+        {
+            "_id": "schema",
+            "version": SCHEMA_VERSION,
+            "indexes": [
+                {"signature": signature, "collection": collection, "name": index.document["name"]}
+                for signature, (collection, index) in wanted.items()
+            ],
+            "migrations": done,
+            "applied_at": datetime.utcnow()
+        },
+        upsert=True
+    )
+    LOGGER.info(
+        f"Schema : Migrated to {SCHEMA_VERSION} "
+        f"({sum(len(i) for i in missing.values())} created, {len(stale)} dropped)"
+    )
+
+
+async def ensure_schema(db: AsyncIOMotorDatabase, auto_migrate: bool = True) -> None:
+    """Cheap startup check, only migrates when the recorded version differs"""
+    applied = await get_applied_schema(db)
+    if applied.get("version") == SCHEMA_VERSION:
+        return
+
+    if auto_migrate:
+        await migrate(db)
+    else:
+        LOGGER.warning(
+            f"Schema : Database is at {applied.get('version')}, expected {SCHEMA_VERSION}. "
+            "Run `python -m bot.database` to apply the indexes."
+        )
@@ -0,0 +1,85 @@
+import asyncio
+import random
+
+from datetime import datetime
+from typing import Optional, Set
+
+from .connection import mongo, COLLECTIONS
+from .models import DBArtistSummary
+from bot.logger import LOGGER
+
+
+SUMMARY_SIZE = 10
+
+
+class ArtistSummaryManager:
+    def __init__(self, interval: float = 30.0):
+        """
+        Args:
+            interval: Seconds to wait before refreshing artists marked as stale,
+                so a burst of inserts for one artist only costs a single refresh
+        """
+        self.interval = interval
+        self._stale: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_stale(self, artist_id: Optional[str]):
+        """Schedule a background refresh of the artist summary"""
+        if not artist_id:
+            return
+        self._stale.add(artist_id)
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._refresh_stale())
+
+    async def _refresh_stale(self):
+        while self._stale:
+            await asyncio.sleep(self.interval)
+            pending, self._stale = self._stale, set()
+            for artist_id in pending:
+                try:
+                    await self.refresh(artist_id)
+                except Exception as e:
+                    LOGGER.error(f"Failed to refresh summary for artist {artist_id}: {e}")
+
+    async def refresh(self, artist_id: str) -> dict:
+        """Rebuild and store the track summary of an artist"""
+        songs = mongo.db[COLLECTIONS["songs"]]
+
+        popular_cursor = songs.find({"artist_id": artist_id}) \
+            .sort([("play_count", -1), ("_id", 1)]).limit(SUMMARY_SIZE)
+        popular = [doc async for doc in popular_cursor]
+
+        recent_cursor = songs.find({"artist_id": artist_id}) \
+            .sort([("created_at", -1), ("_id", -1)]).limit(SUMMARY_SIZE)
+        recent = [doc async for doc in recent_cursor]
+
+        # seeded with the artist id so the pick stays the same until the tracks change
+        ids = sorted([doc["_id"] async for doc in songs.find({"artist_id": artist_id}, {"_id": 1})])
+        picks = random.Random(artist_id).sample(ids, min(SUMMARY_SIZE, len(ids)))
+        picked = {doc["_id"]: doc async for doc in songs.find({"_id": {"$in": picks}})}
+        shuffled = [picked[_id] for _id in picks if _id in picked]
+
+        summary = {
+            "artist_id": artist_id,
+            "popular": popular,
+            "recent": recent,
+            "shuffled": shuffled,
+            "track_count": len(ids),
+            "updated_at": datetime.utcnow()
+        }
+        await mongo.db[COLLECTIONS["artist_summaries"]].update_one(
+            {"artist_id": artist_id}, {"$set": summary}, upsert=True
+        )
+        return summary
+
+    async def get(self, artist_id: str) -> DBArtistSummary:
+        """Get the stored summary, building it on first access"""
+        summary = await mongo.db[COLLECTIONS["artist_summaries"]].find_one(
+            {"artist_id": artist_id}
+        )
+        if summary is None:
+            summary = await self.refresh(artist_id)
+        return DBArtistSummary(**summary)
+
+
+artist_summaries = ArtistSummaryManager()
@@ -1,21 +1,70 @@
+from hashlib import blake2b
+
 from .models import BaseTrack, DBTrack
 from .connection import mongo, COLLECTIONS
+from .writer import track_writer
+from bot.logger import LOGGER
+
+
+def file_hash(file_id: str) -> int:
+    """64 bit hash of a file_unique_id, a fraction of the memory of the string itself"""
+    return int.from_bytes(blake2b(file_id.encode(), digest_size=8).digest(), "big")
+
 
 class TrackManager:
+    # hashes of every indexed file_unique_id, once loaded a miss means the track is new
+    known_files = set()
+    loaded = False
+
+    @staticmethod
+    async def load_known():
+        """Fill `known_files` from the songs collection, done once at startup"""
+        cursor = mongo.db[COLLECTIONS["songs"]].find({}, {"file_unique_id": 1, "_id": 0}, batch_size=10000)
+        async for document in cursor:
+            if document.get("file_unique_id"):
+                TrackManager.known_files.add(file_hash(document["file_unique_id"]))
+        TrackManager.loaded = True
+        LOGGER.info(f"TrackManager : {len(TrackManager.known_files)} indexed files loaded")
+
+
+    @staticmethod
+    def forget(file_id: str):
+        """The track left the library (trashed)"""
+        if file_id:
+            TrackManager.known_files.discard(file_hash(file_id))
+
+
+    @staticmethod
+    def is_known(file_id: str) -> bool:
+        """Indexed as far as memory knows, no database read"""
+        return file_hash(file_id) in TrackManager.known_files
+
 
     @staticmethod
     async def check_exists(file_id: str):
         """Searches the Database if Track already exists"""
+        key = file_hash(file_id)
+        if key in TrackManager.known_files:
+            return True
+        if TrackManager.loaded:
+            return False
+
         document = await mongo.db[COLLECTIONS["songs"]].find_one(
             {"file_unique_id": file_id}
         )
+        if document:
+            TrackManager.known_files.add(key)
         return document is not None
 
 
     @staticmethod
-    async def insert_track(data: BaseTrack):
+    async def insert_track(data: BaseTrack) -> bool:
+        """Returns False if the message was already indexed"""
         track = DBTrack(**data.dict())
-        await mongo.db[COLLECTIONS["songs"]].insert_one(track.dict(by_alias=True, exclude_unset=True))
-
-
-
+        document = track.dict(by_alias=True, exclude_unset=True)
+        # exclude_unset keeps the generated `_id` out but would drop the timestamps too
+        document.update(created_at=track.created_at, updated_at=track.updated_at)
+        inserted = await track_writer.upsert(document)
+        if track.file_unique_id:
+            TrackManager.known_files.add(file_hash(track.file_unique_id))
+        return inserted
@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from .models import DBTrash
+from .track import TrackManager, file_hash
+from .connection import mongo, COLLECTIONS
+from bot.logger import LOGGER
+
+
+class TrashManager:
+
+    @staticmethod
+    async def move_track(track: dict, reason: str):
+        """Move a song document to trash, hiding it from every listing"""
+        trash = DBTrash(
+            original_song_data=track,
+            chat_id=track["chat_id"],
+            msg_id=track["msg_id"],
+            reason=reason
+        )
+        # keyed on the message so concurrent plays of a dead track only trash it once
+        await mongo.db[COLLECTIONS["trash"]].update_one(
+            {"chat_id": trash.chat_id, "msg_id": trash.msg_id, "status": "pending"},
+            {"$setOnInsert": trash.dict(exclude={"id"})},
+            upsert=True
+        )
+        await mongo.db[COLLECTIONS["songs"]].delete_one({"_id": track["_id"]})
+        TrackManager.forget(track.get("file_unique_id"))
+        LOGGER.info(f"Track moved to trash: '{track.get('title')}' ({trash.chat_id}/{trash.msg_id}) - {reason}")
+
+
+    @staticmethod
+    async def get_pending(limit: int = 20) -> List[DBTrash]:
+        cursor = mongo.db[COLLECTIONS["trash"]].find({"status": "pending"}) \
+            .sort("moved_at", -1).limit(limit)
+        return [DBTrash(**doc) async for doc in cursor]
+
+
+    @staticmethod
+    async def restore(trash_id: str) -> Optional[DBTrash]:
+        """
+        Put a trashed song back into the library.
+        A message indexed again while its song was trashed is left as it is,
+        the entry is closed with status `reindexed`.
+        """
+        if not ObjectId.is_valid(trash_id):
+            return None
+        document = await mongo.db[COLLECTIONS["trash"]].find_one(
+            {"_id": ObjectId(trash_id), "status": "pending"}
+        )
+        if not document:
+            return None
+
+        song = document["original_song_data"]
+        song["updated_at"] = datetime.utcnow()
+        songs = mongo.db[COLLECTIONS["songs"]]
+        status = "restored"
+        if await songs.find_one({"chat_id": document["chat_id"], "msg_id": document["msg_id"]}, {"_id": 1}):
+            status = "reindexed"
+        else:
+            try:
+                await songs.replace_one({"_id": song["_id"]}, song, upsert=True)
+            except DuplicateKeyError:
+                # indexed again in the meantime
+                status = "reindexed"
+            else:
+                if song.get("file_unique_id"):
+                    TrackManager.known_files.add(file_hash(song["file_unique_id"]))
+
+        await mongo.db[COLLECTIONS["trash"]].update_one(
+            {"_id": document["_id"]},
+            {"$set": {"status": status, "restored_at": datetime.utcnow()}}
+        )
+        document["status"] = status
+        return DBTrash(**document)
@@ -0,0 +1,146 @@
+import asyncio
+
+from datetime import timedelta
+
+from typing import List, Optional, Tuple
+
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
+
+from .connection import mongo, COLLECTIONS
+
+
+DUPLICATE_KEY = 11000
+# updated_at is stamped before a write is sent, queued in a bulk window or behind another writer.
+# Readers polling on it look back this far so writes that commit late are not skipped
+COMMIT_LAG = timedelta(seconds=60)
+
+
+class BulkWriter:
+    def __init__(self, collection: str, key: Tuple[str, ...], window: float = 0.02, max_batch: int = 500):
+        """
+        Collects inserts for a short window and sends them as one unordered `bulk_write`.
+        Each insert is an upsert on `key`, so racing workers can not create duplicates.
+
+        Args:
+            collection: Collection written to
+            key: Fields of the unique index documents are matched on
+            window: Seconds to wait for more documents before flushing
+            max_batch: Flush right away once this many documents are waiting
+        """
+        self.collection = collection
+        self.key = key
+        self.window = window
+        self.max_batch = max_batch
+
+        self._pending: List[Tuple[UpdateOne, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def upsert(self, document: dict) -> bool:
+        """
+        Insert `document` unless one with the same key exists
+        Returns:
+            True if it was inserted
+        """
+        future = asyncio.get_running_loop().create_future()
+        operation = UpdateOne(
+            {field: document.get(field) for field in self.key},
+            {"$setOnInsert": document},
+            upsert=True
+        )
+        self._pending.append((operation, future))
+
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif not self._task or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        errors = {}
+        try:
+            result = await mongo.db[self.collection].bulk_write([operation for operation, _ in batch], ordered=False)
+            upserted = result.upserted_ids
+        except BulkWriteError as e:
+            upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+            errors = {item["index"]: item for item in e.details.get("writeErrors", [])}
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            error = errors.get(index)
+            # two upserts racing on the same key, the other one inserted it
+            if error and error["code"] != DUPLICATE_KEY:
+                future.set_exception(WriteError(error["errmsg"], error["code"], error))
+            else:
+                future.set_result(index in upserted)
+
+
+class BulkDeleter:
+    def __init__(self, collection: str, window: float = 0.05, max_batch: int = 500):
+        """
+        Collects deletes for a short window and sends them as one unordered `bulk_write`,
+        the counterpart of `BulkWriter` for documents that are done with.
+
+        Args:
+            collection: Collection deleted from
+            window: Seconds to wait for more deletes before flushing
+            max_batch: Flush right away once this many deletes are waiting
+        """
+        self.collection = collection
+        self.window = window
+        self.max_batch = max_batch
+
+        self._pending: List[Tuple[DeleteOne, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def delete(self, query: dict):
+        """Delete the document matching `query`, returns once the batch is written"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((DeleteOne(query), future))
+
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif not self._task or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+        await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            await mongo.db[self.collection].bulk_write([operation for operation, _ in batch], ordered=False)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+track_writer = BulkWriter(COLLECTIONS["songs"], ("chat_id", "msg_id"))
+artist_writer = BulkWriter(COLLECTIONS["artists"], ("artist_id", "provider"))
+album_writer = BulkWriter(COLLECTIONS["albums"], ("album_id", "provider"))
+job_deleter = BulkDeleter(COLLECTIONS["index_jobs"])
@@ -3,20 +3,89 @@ import asyncio
 import re
 import time
 
+from jose import jwt
+from typing import Awaitable, Callable
+
 from .models import *
-from ..utils.errors import AppleMusicError
+from bot.logger import LOGGER
+from ..utils.batcher import BatchLoader
+from ..utils.breaker import CircuitBreaker
+from ..utils.errors import AppleMusicError, MetadataNotFound
+
+BATCH_SIZE = 50  # ids per catalogue request
+HEDGE_DELAY = 1.5  # seconds before the same request also goes to the next storefront
+TOKEN_REFRESH_MARGIN = 600  # seconds before expiry the token is replaced in the background
 
 class AppleMusic:
-    def __init__(self, session: aiohttp.ClientSession, dev_token: Optional[str] = None, storefronts: Optional[List[str]] = None):
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        dev_token: Optional[str] = None,
+        storefronts: Optional[List[str]] = None,
+        dev_token_expiry: int = 0,
+        on_token: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Args:
+            dev_token, dev_token_expiry: Token saved by a previous run, skips the scrape on startup
+            on_token: Called with every new token and its expiry, to persist it
+            breaker: Records the outcome of every request made to Apple
+        """
         self.storefronts = storefronts or ['us', 'in', 'jp']
         self.dev_token = dev_token
-        self.dev_token_expiry = 0  # UNIX timestamp
+        self.dev_token_expiry = dev_token_expiry if dev_token else 0  # UNIX timestamp
         self.session = session
+        self.on_token = on_token
+        self.breaker = breaker or CircuitBreaker('apple-music', excluded=(MetadataNotFound,))
+
+        self._token_task: Optional[asyncio.Task] = None
+        self._token_timer: Optional[asyncio.TimerHandle] = None
+
+        self._affinity: Dict[str, str] = {}  # request kind (songs, albums, search...) -> storefront
+        self._cooldown: Dict[str, float] = {}  # storefront -> monotonic time its 429 ends
+
+        # single lookups made at the same time go out as one `ids=` request
+        self.song_loader = BatchLoader(self._fetch_songs, max_batch=BATCH_SIZE)
+        self.album_loader = BatchLoader(lambda ids: self._get_many('albums', ids), max_batch=BATCH_SIZE)
+        self.artist_loader = BatchLoader(lambda ids: self._get_many('artists', ids), max_batch=BATCH_SIZE)
 
     async def _ensure_token(self):
         now = int(time.time())
+        if self.dev_token and now < self.dev_token_expiry - TOKEN_REFRESH_MARGIN:
+            if not self._token_timer:
+                self._schedule_refresh()
+            return
+
+        refresh = self._refresh_token()
+        # about to expire, keep using it while the new one is fetched
         if not self.dev_token or now >= self.dev_token_expiry:
+            await asyncio.shield(refresh)
+
+    def _refresh_token(self) -> asyncio.Task:
+        """Start a token scrape unless one is running, every caller shares it"""
+        if not self._token_task or self._token_task.done():
+            self._token_task = asyncio.create_task(self._update_token())
+            self._token_task.add_done_callback(self._token_done)
+        return self._token_task
+
+    async def _update_token(self):
+        async with self.breaker.track():
             self.dev_token, self.dev_token_expiry = await self.get_token()
+        self._schedule_refresh()
+        if self.on_token:
+            await self.on_token(self.dev_token, self.dev_token_expiry)
+
+    def _token_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            LOGGER.error(f"AppleMusic : Token refresh failed - {task.exception()}")
+
+    def _schedule_refresh(self):
+        """Replace the token shortly before it expires, even if no request comes in"""
+        if self._token_timer:
+            self._token_timer.cancel()
+        delay = max(self.dev_token_expiry - TOKEN_REFRESH_MARGIN - time.time(), 0)
+        self._token_timer = asyncio.get_running_loop().call_later(delay, self._refresh_token)
 
     def _headers(self) -> Dict[str, str]:
         headers = {
@@ -26,26 +95,91 @@ class AppleMusic:
         }
         return headers
 
-    async def _get(self, endpoint: str, params: Optional[Dict] = None):
-        await self._ensure_token()
-        last_exception = None
+    def _storefront_order(self, endpoint: str) -> List[str]:
+        """Storefronts to try, the one that last served this kind of request first, rate limited ones last"""
+        kind = endpoint.lstrip('/').split('/')[0]
+        preferred = self._affinity.get(kind)
+        now = time.monotonic()
+        # sort is stable, the configured order decides the rest
+        return sorted(
+            self.storefronts[:3],  # Try up to 3 storefronts
+            key=lambda storefront: (self._cooldown.get(storefront, 0) > now, storefront != preferred)
+        )
 
-        for storefront in self.storefronts[:3]:  # Try up to 3 storefronts
-            url = f"https://amp-api.music.apple.com/v1/catalog/{storefront}/{endpoint.lstrip('/')}"
-            try:
-                async with self.session.get(url, headers=self._headers(), params=params) as resp:
-                    if resp.status == 404:
-                        continue
-                    if resp.status == 429:
-                        retry_after = int(resp.headers.get("Retry-After", "30"))
-                        await asyncio.sleep(retry_after)
-                        continue
-                    resp.raise_for_status()
-                    return await resp.json()
-            except aiohttp.ClientResponseError as e:
-                last_exception = e
-                continue
+    async def _request(self, storefront: str, endpoint: str, params: Optional[Dict] = None):
+        url = f"https://amp-api.music.apple.com/v1/catalog/{storefront}/{endpoint.lstrip('/')}"
+        async with self.breaker.track(), self.session.get(url, headers=self._headers(), params=params) as resp:
+            if resp.status == 404:
+                raise MetadataNotFound(f'Not found in {storefront} - {endpoint}')
+            if resp.status == 429:
+                retry_after = min(int(resp.headers.get("Retry-After", "30")), 30)
+                self._cooldown[storefront] = time.monotonic() + retry_after
+                raise AppleMusicError(f'Rate limited in {storefront} for {retry_after}s')
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def _get(self, endpoint: str, params: Optional[Dict] = None, storefronts: Optional[List[str]] = None):
+        """
+        Request `endpoint` from the preferred storefront. The next storefront is asked when
+        one fails, or in parallel when the first has not answered within `HEDGE_DELAY`.
+        """
+        _, result = await self._get_from(endpoint, params, storefronts)
+        return result
 
+    async def _get_from(self, endpoint: str, params: Optional[Dict] = None, storefronts: Optional[List[str]] = None):
+        """Same as `_get`, also returns the storefront that answered"""
+        await self._ensure_token()
+        last_exception = None
+        not_found = 0
+        storefronts = storefronts or self._storefront_order(endpoint)
+
+        now = time.monotonic()
+        available = [storefront for storefront in storefronts if self._cooldown.get(storefront, 0) <= now]
+        if not available:
+            # the limit is usually the token's, not a storefront's. Fail now and leave the
+            # waiting to the breaker, the rate limiter and the job retries
+            retry_after = min(self._cooldown[storefront] for storefront in storefronts) - now
+            raise AppleMusicError(f'Rate limited in every storefront for {retry_after:.0f}s')
+        storefronts = available
+
+        waiting = list(storefronts)
+        running: Dict[asyncio.Task, str] = {}
+
+        def launch():
+            storefront = waiting.pop(0)
+            running[asyncio.create_task(self._request(storefront, endpoint, params))] = storefront
+
+        launch()
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    running, timeout=HEDGE_DELAY if waiting else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # slow storefront, hedge with the next one
+                    launch()
+                    continue
+
+                for task in done:
+                    storefront = running.pop(task)
+                    try:
+                        result = task.result()
+                    except MetadataNotFound:
+                        not_found += 1
+                    except (aiohttp.ClientError, asyncio.TimeoutError, AppleMusicError) as e:
+                        last_exception = e
+                    else:
+                        self._affinity[endpoint.lstrip('/').split('/')[0]] = storefront
+                        return storefront, result
+
+                if not running and waiting:
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        if not_found == len(storefronts):
+            raise MetadataNotFound(f'Not found in any storefront - {endpoint}')
         raise AppleMusicError(f'Failed to fetch metadata - {last_exception if last_exception else ""}') 
 
     def get_artwork_url(self, artwork_data: Optional[Dict], size: int = 1200) -> Optional[str]:
@@ -55,61 +189,65 @@ class AppleMusic:
         return url.replace('{w}', str(size)).replace('{h}', str(size))
 
 
-    async def search(self, term: str, types: str = "songs", limit: int = 1):
+    async def _get_many(self, kind: str, ids: List[str], params: Optional[Dict] = None) -> Dict[str, Dict]:
         """
-        Search using query
+        Fetch resources with `ids=` requests, ids missing from the storefront that answered
+        are tried in the remaining ones. Ids still missing when a storefront fails map to the
+        error instead of a resource, so a transient failure is never cached as not found.
         Args:
-            term: query
-            types: query type (songs|albums|artits).
-                You can combine this using commas - example : songs,albums,artists
-            limit: no. of results
+            kind: songs|albums|artists
         """
-        endpoint = "search"
-        params = {
-            'term': term,
-            'types': types,
-            'limit': limit
-        }
-
-        resp = await self._get(endpoint, params)
-
-        try:
-            track_id = resp['results']['songs'].get('data', [])[0].get('id')
-        except KeyError:
-            raise AppleMusicError(f"Track not found : {term}")
-
-        if track_id:
-            track_data = await self.get_song(track_id)
-            track_data = track_data['data'][0]
-            cover_url = self.get_artwork_url(track_data['attributes'].get('artwork'))
-            return BaseTrack(
-                title=track_data['attributes']['name'],
-                track_id=track_id,
-                artist=track_data['attributes']['artistName'],
-                artist_id=track_data['relationships']['artists']['data'][0]['id'], #assumign first one will always be main artist
-                album=track_data['attributes']['albumName'],
-                album_id=track_data['relationships']['albums']['data'][0]['id'],
-                isrc=track_data['attributes']['isrc'],
-                track_no=track_data['attributes']['trackNumber'],
-                provider='apple-music',
-                duration=track_data['attributes']['durationInMillis'],
-                cover_url=cover_url,
-                tags=track_data['attributes']['genreNames']
-            )
-
-
-    async def get_song(self, song_id: str):
-        """Get song using apple music id"""
-        endpoint = f"songs/{song_id}"
-        return await self._get(endpoint)
-
+        found = {}
+        for start in range(0, len(ids), BATCH_SIZE):
+            missing = ids[start:start + BATCH_SIZE]
+            remaining = self._storefront_order(kind)
+            while missing and remaining:
+                try:
+                    storefront, resp = await self._get_from(kind, {'ids': ','.join(missing), **(params or {})}, remaining)
+                except MetadataNotFound:
+                    break
+                except AppleMusicError as e:
+                    LOGGER.warning(f"AppleMusic : {kind} lookup failed - {e}")
+                    found.update((_id, e) for _id in missing)
+                    break
+                remaining = [other for other in remaining if other != storefront]
+                for item in resp.get('data', []):
+                    found[item['id']] = item
+                missing = [_id for _id in missing if _id not in found]
+        return found
+
+
+    async def _fetch_songs(self, song_ids: List[str]) -> Dict[str, Dict]:
+        # artists come back inline, they are usually looked up right after
+        songs = await self._get_many('songs', song_ids, {'include': 'artists'})
+        for song in songs.values():
+            if isinstance(song, Exception):
+                continue
+            for artist in song.get('relationships', {}).get('artists', {}).get('data', []):
+                if 'attributes' in artist:
+                    self.artist_loader.prime(artist['id'], artist)
+        return songs
+
+
+    def _to_track(self, track_data: Dict) -> BaseTrack:
+        cover_url = self.get_artwork_url(track_data['attributes'].get('artwork'))
+        return BaseTrack(
+            title=track_data['attributes']['name'],
+            track_id=track_data['id'],
+            artist=track_data['attributes']['artistName'],
+            artist_id=track_data['relationships']['artists']['data'][0]['id'], #assumign first one will always be main artist
+            album=track_data['attributes']['albumName'],
+            album_id=track_data['relationships']['albums']['data'][0]['id'],
+            isrc=track_data['attributes']['isrc'],
+            track_no=track_data['attributes']['trackNumber'],
+            provider='apple-music',
+            duration=track_data['attributes']['durationInMillis'],
+            cover_url=cover_url,
+            tags=track_data['attributes']['genreNames']
+        )
 
-    async def get_album(self, album_id: str):
-        """Get album using apple music id"""
-        endpoint = f"albums/{album_id}"
-        album_data = await self._get(endpoint)
-        album_data = album_data['data'][0]
 
+    def _to_album(self, album_data: Dict) -> BaseAlbum:
         cover_url = self.get_artwork_url(album_data['attributes'].get('artwork'))
 
         try:
@@ -118,7 +256,7 @@ class AppleMusic:
             artist_id = '0' # fallback for various artist 
         return BaseAlbum(
             title=album_data['attributes']['name'],
-            album_id=album_id,
+            album_id=album_data['id'],
             artist=album_data['attributes']['artistName'],
             artist_id=artist_id,
             provider='apple-music',
@@ -129,22 +267,75 @@ class AppleMusic:
         )
 
 
-    async def get_artist(self, artist_id: str):
-        endpoint = f"artists/{artist_id}"
-        artist_data = await self._get(endpoint)
-        artist_data = artist_data['data'][0]
-
+    def _to_artist(self, artist_data: Dict) -> BaseArtist:
         cover_url = self.get_artwork_url(artist_data['attributes'].get('artwork'))
-        
+
         return BaseArtist(
             name=artist_data['attributes']['name'],
-            artist_id=artist_id,
+            artist_id=artist_data['id'],
             provider='apple-music',
             tags=artist_data['attributes']['genreNames'],
             cover_url=cover_url
         )
 
 
+    async def search(self, term: str, types: str = "songs", limit: int = 1):
+        """
+        Search using query
+        Args:
+            term: query
+            types: query type (songs|albums|artits).
+                You can combine this using commas - example : songs,albums,artists
+            limit: no. of results
+        """
+        endpoint = "search"
+        params = {
+            'term': term,
+            'types': types,
+            'limit': limit
+        }
+
+        resp = await self._get(endpoint, params)
+
+        try:
+            track_id = resp['results']['songs'].get('data', [])[0].get('id')
+        except (KeyError, IndexError):
+            raise MetadataNotFound(f"Track not found : {term}")
+
+        if track_id:
+            # full details of concurrent searches are fetched together
+            track_data = await self.get_song(track_id)
+            return self._to_track(track_data)
+
+
+    async def get_song_by_isrc(self, isrc: str) -> BaseTrack:
+        resp = await self._get('songs', {'filter[isrc]': isrc})
+        if not resp.get('data'):
+            raise MetadataNotFound(f"Song not found : {isrc}")
+        return self._to_track(resp['data'][0])
+
+
+    async def get_song(self, song_id: str) -> Dict:
+        """Get song using apple music id"""
+        song = await self.song_loader.load(song_id)
+        if not song:
+            raise MetadataNotFound(f"Song not found : {song_id}")
+        return song
+
+
+    async def get_album(self, album_id: str):
+        """Get album using apple music id"""
+        album_data = await self.album_loader.load(album_id)
+        if not album_data:
+            raise MetadataNotFound(f"Album not found : {album_id}")
+        return self._to_album(album_data)
+
+
+    async def get_artist(self, artist_id: str):
+        artist_data = await self.artist_loader.load(artist_id)
+        if not artist_data:
+            raise MetadataNotFound(f"Artist not found : {artist_id}")
+        return self._to_artist(artist_data)
 
 
     async def get_token(self) -> (str, int):
@@ -172,6 +363,9 @@ class AppleMusic:
             raise AppleMusicError("Login : Token not Found")
 
         token = token_match.group(0)
-        # Approximate expiry: Apple tokens are usually valid for 1 hour (3600 seconds)
-        expiry = int(time.time()) + 3600 - 60  # refresh a bit early
+        try:
+            expiry = int(jwt.get_unverified_claims(token)["exp"])
+        except Exception:
+            # Approximate expiry: Apple tokens are usually valid for 1 hour (3600 seconds)
+            expiry = int(time.time()) + 3600
         return token, expiry
\ No newline at end of file
@@ -1,10 +1,21 @@
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Type
 
 from .amp import AppleMusic
 from .spotify import SpotifyAPI
 from .models import *
+from .tags import is_complete
 from config import Config
 from bot.logger import LOGGER
+from bot.database.connection import mongo, COLLECTIONS
+from bot.utils.breaker import CircuitBreaker
+from bot.utils.cache import TTLCache
+from bot.utils.errors import CircuitOpen, MetadataNotFound
+from bot.utils.queue import TokenBucket
+from bot.utils.singleflight import SingleFlight
+
+_MISSING = object()
 
 class MetadataManager:
     session: ClientSession
@@ -12,21 +23,104 @@ class MetadataManager:
         self.client = None
         self.session = None
         self.provider = Config.METADATA_PROVIDER
+        # only provider calls are limited, cheap work in the indexer runs at full speed
+        self.limiter = TokenBucket(Config.METADATA_RATE_LIMIT)
+        # lookup results (model dicts, None when the provider has nothing) in front of `metadata_cache`
+        self.cache = TTLCache(maxsize=10000, ttl=Config.METADATA_CACHE_TTL)
+        self._flight = SingleFlight()
+        # fail fast while the provider is down, tracks fall back to telegram metadata meanwhile.
+        # the clients record every request they make to the provider on it
+        self.breaker = CircuitBreaker(
+            self.provider,
+            failure_threshold=Config.METADATA_BREAKER_THRESHOLD,
+            reset_timeout=Config.METADATA_BREAKER_RESET,
+            excluded=(MetadataNotFound,)
+        )
 
 
     async def setup(self) -> None:
         """Initialise the necessary clients"""
-        self.session = ClientSession()
+        self.session = ClientSession(timeout=ClientTimeout(total=Config.METADATA_TIMEOUT))
         if self.provider == 'apple-music':
-            self.client = AppleMusic(self.session)
+            # reuse the token of the last run instead of scraping it again
+            saved = await mongo.db[COLLECTIONS['meta']].find_one({"_id": "apple_music_token"}) or {}
+            self.client = AppleMusic(
+                self.session,
+                dev_token=saved.get("token"),
+                dev_token_expiry=saved.get("expiry", 0),
+                on_token=self._save_apple_token,
+                breaker=self.breaker
+            )
         else:
-            self.client = SpotifyAPI(self.session, Config.SPOTIFY_CLIENT, Config.SPOTIFY_TOKEN)
+            self.client = SpotifyAPI(self.session, Config.SPOTIFY_CLIENT, Config.SPOTIFY_SECRET, breaker=self.breaker)
+
+
+    async def _save_apple_token(self, token: str, expiry: int):
+        await mongo.db[COLLECTIONS['meta']].replace_one(
+            {"_id": "apple_music_token"},
+            {"token": token, "expiry": expiry, "updated_at": datetime.utcnow()},
+            upsert=True
+        )
+
+
+    async def _cached(self, kind: str, key: str, model: Type[BaseModel], fetch: Callable[[], Awaitable[BaseModel]]) -> BaseModel:
+        """
+        Memoise a provider lookup in memory and in MongoDB, concurrent callers share one request.
+        Lookups the provider has no result for are cached as well, for `METADATA_NEGATIVE_TTL`.
+        """
+        cache_key = f"{self.provider}:{kind}:{key}"
+        value = self.cache.get(cache_key, _MISSING)
+
+        if value is _MISSING:
+            value = await self._flight.run(cache_key, lambda: self._load(cache_key, fetch))
+
+        if value is None:
+            raise MetadataNotFound(f"No {kind} found for {key}")
+        # a fresh model every time, callers fill in their own fields
+        return model(**value)
+
+
+    async def _load(self, cache_key: str, fetch: Callable[[], Awaitable[BaseModel]]):
+        collection = mongo.db[COLLECTIONS['metadata_cache']]
+        try:
+            document = await collection.find_one({"_id": cache_key, "expires_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            LOGGER.warning(f"MetadataManager : Cache read failed - {e}")
+            document = None
+
+        if document:
+            ttl = (document["expires_at"] - datetime.utcnow()).total_seconds()
+            self.cache.set(cache_key, document["value"], ttl=min(ttl, self.cache.ttl))
+            return document["value"]
+
+        if not self.breaker.allow():
+            raise CircuitOpen(f"{self.provider} is unavailable")
+        try:
+            await self.limiter.acquire()
+            result = await fetch()
+            if result is None:
+                raise MetadataNotFound(cache_key)
+            value, ttl = result.dict(), Config.METADATA_CACHE_TTL
+        except MetadataNotFound:
+            value, ttl = None, Config.METADATA_NEGATIVE_TTL
+
+        self.cache.set(cache_key, value, ttl=min(ttl, self.cache.ttl))
+        try:
+            await collection.replace_one(
+                {"_id": cache_key},
+                {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+                upsert=True
+            )
+        except Exception as e:
+            LOGGER.warning(f"MetadataManager : Cache write failed - {e}")
+        return value
 
 
     async def search(self, title: str, artist: str) -> BaseTrack:
         """Get track details from query"""
         try:
-            result = await self.client.search(f"{title} {artist}")
+            key = f"{title or ''}|{artist or ''}".casefold().strip()
+            result = await self._cached("search", key, BaseTrack, lambda: self.client.search(f"{title} {artist}"))
             return result
         except Exception as e:
             LOGGER.error(e)
@@ -36,10 +130,37 @@ class MetadataManager:
             )
 
 
+    async def get_song_by_isrc(self, isrc: str) -> Optional[BaseTrack]:
+        """Exact lookup, None when the provider has no such track or can't be asked"""
+        try:
+            return await self._cached("isrc", isrc, BaseTrack, lambda: self.client.get_song_by_isrc(isrc))
+        except Exception as e:
+            LOGGER.debug(f"MetadataManager : ISRC lookup failed for {isrc} - {e}")
+            return None
+
+
+    async def identify(self, title: str, artist: str, tags: Optional[BaseTrack] = None) -> BaseTrack:
+        """
+        Track details, preferring what the file says about itself:
+        an exact ISRC lookup first, the tags alone when they are complete, a search otherwise
+        """
+        if tags and tags.isrc:
+            result = await self.get_song_by_isrc(tags.isrc)
+            if result:
+                return result
+
+        if tags and is_complete(tags):
+            return tags
+
+        if tags:
+            title, artist = tags.title, tags.artist
+        return await self.search(title, artist)
+
+
     async def get_artist(self, artist_id: str, artist_name: str) -> BaseArtist:
         try:
             assert(artist_id)
-            result = await self.client.get_artist(artist_id)
+            result = await self._cached("artist", artist_id, BaseArtist, lambda: self.client.get_artist(artist_id))
             return result
         except Exception as e:
             LOGGER.error(e)
@@ -51,7 +172,7 @@ class MetadataManager:
     
     async def get_album(self, album_id: str) -> BaseAlbum:
         try:
-            result = await self.client.get_album(album_id)
+            result = await self._cached("album", album_id, BaseAlbum, lambda: self.client.get_album(album_id))
             return result
         except Exception as e:
             LOGGER.error(e)
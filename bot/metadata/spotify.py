@@ -1,77 +1,186 @@
 import asyncio
 import base64
+import time
 
 from aiohttp import ClientSession
 from typing import Optional, Dict, Any, List
 
-from ..utils.errors import SpotifyError
+from .models import BaseTrack, BaseAlbum, BaseArtist
+from ..utils.batcher import BatchLoader
+from ..utils.breaker import CircuitBreaker
+from ..utils.errors import SpotifyError, MetadataNotFound
+
+# max ids per request of the multi-id endpoints
+BATCH_SIZES = {'albums': 20, 'artists': 50}
+TOKEN_REFRESH_MARGIN = 300  # seconds before expiry a new token is fetched in the background
+MAX_RETRIES = 3
+MAX_RETRY_AFTER = 30  # seconds of a 429 waited out inline, longer penalties fail the request
 
 
 class SpotifyAPI:
-    def __init__(self, session: ClientSession, client_id: str, client_secret: str):
+    def __init__(self, session: ClientSession, client_id: str, client_secret: str, breaker: Optional[CircuitBreaker] = None):
         self.client_id = client_id
         self.client_secret = client_secret
         self.base_url = "https://api.spotify.com/v1"
         self.token_url = "https://accounts.spotify.com/api/token"
         self.access_token = None
+        self.token_expiry = 0  # UNIX timestamp
         self.session = session
+        # records the outcome of every request made to Spotify
+        self.breaker = breaker or CircuitBreaker('spotify', excluded=(MetadataNotFound,))
+
+        self._token_task: Optional[asyncio.Task] = None
+        self._retry_at = 0.0  # monotonic time a 429 lets requests through again
+
+        # single lookups made at the same time go out as one `ids=` request
+        self.album_loader = BatchLoader(lambda ids: self._get_many('albums', ids), max_batch=BATCH_SIZES['albums'])
+        self.artist_loader = BatchLoader(lambda ids: self._get_many('artists', ids), max_batch=BATCH_SIZES['artists'])
+
 
-    
     async def _get_access_token(self) -> None:
         """Get access token using client credentials flow"""
         auth_string = f"{self.client_id}:{self.client_secret}"
         auth_bytes = auth_string.encode("ascii")
         auth_base64 = base64.b64encode(auth_bytes).decode("ascii")
-        
+
         headers = {
             "Authorization": f"Basic {auth_base64}",
             "Content-Type": "application/x-www-form-urlencoded"
         }
-        
+
         data = {"grant_type": "client_credentials"}
-        
-        async with self.session.post(self.token_url, headers=headers, data=data) as response:
+
+        async with self.breaker.track(), self.session.post(self.token_url, headers=headers, data=data) as response:
             if response.status == 200:
                 token_data = await response.json()
                 self.access_token = token_data["access_token"]
+                self.token_expiry = int(time.time()) + token_data.get("expires_in", 3600)
             else:
                 raise SpotifyError(f"Failed to get access token: {response.status}")
-    
+
+    async def _ensure_token(self, force: bool = False) -> None:
+        """Single-flight token refresh, started ahead of expiry so requests rarely wait for it"""
+        now = time.time()
+        if not force and self.access_token and now < self.token_expiry - TOKEN_REFRESH_MARGIN:
+            return
+        if not self._token_task or self._token_task.done():
+            self._token_task = asyncio.create_task(self._get_access_token())
+        if force or not self.access_token or now >= self.token_expiry:
+            await asyncio.shield(self._token_task)
+
     async def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict[Any, Any]:
-        """Make authenticated request to Spotify API"""
-        if not self.access_token:
-            await self._get_access_token()
-        
-        headers = {"Authorization": f"Bearer {self.access_token}"}
+        """Make authenticated request to Spotify API, waiting out 429s for every caller at once"""
+        await self._ensure_token()
         url = f"{self.base_url}/{endpoint}"
-        
-        async with self.session.get(url, headers=headers, params=params) as response:
-            if response.status == 401:  # Token expired
-                await self._get_access_token()
-                headers = {"Authorization": f"Bearer {self.access_token}"}
-                async with self.session.get(url, headers=headers, params=params) as retry_response:
-                    return await retry_response.json()
-            elif response.status == 200:
-                return await response.json()
-            else:
-                raise SpotifyError(f"API request failed: {response.status}")
-    
-    async def search(self, title: str, artist: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search for tracks by title and artist"""
-        query = f"track:{title} artist:{artist}"
+
+        for _ in range(MAX_RETRIES):
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            headers = {"Authorization": f"Bearer {self.access_token}"}
+            async with self.breaker.track(), self.session.get(url, headers=headers, params=params) as response:
+                if response.status == 200:
+                    return await response.json()
+                if response.status == 401:  # Token expired
+                    await self._ensure_token(force=True)
+                elif response.status == 429:
+                    retry_after = int(response.headers.get("Retry-After", "5"))
+                    if retry_after > MAX_RETRY_AFTER:
+                        # counts as a failure, the breaker pauses lookups instead of every worker sleeping
+                        raise SpotifyError(f"Rate limited for {retry_after}s - {endpoint}")
+                    self._retry_at = max(self._retry_at, time.monotonic() + retry_after)
+                elif response.status == 404:
+                    raise MetadataNotFound(f"Not found - {endpoint}")
+                else:
+                    raise SpotifyError(f"API request failed: {response.status}")
+
+        raise SpotifyError(f"API request failed after {MAX_RETRIES} attempts - {endpoint}")
+
+    async def _get_many(self, kind: str, ids: List[str]) -> Dict[str, Dict]:
+        """
+        Fetch objects with the multi-id endpoints
+        Args:
+            kind: albums|artists
+        """
+        found = {}
+        size = BATCH_SIZES[kind]
+        for start in range(0, len(ids), size):
+            response = await self._make_request(kind, {"ids": ",".join(ids[start:start + size])})
+            # unknown ids come back as null
+            for item in response.get(kind, []):
+                if item:
+                    found[item["id"]] = item
+        return found
+
+    def _cover(self, images: Optional[List[Dict]]) -> Optional[str]:
+        # largest image comes first
+        return images[0]["url"] if images else None
+
+    def _to_track(self, track: Dict) -> BaseTrack:
+        return BaseTrack(
+            title=track["name"],
+            track_id=track["id"],
+            artist=track["artists"][0]["name"], # first one is the main artist
+            artist_id=track["artists"][0]["id"],
+            album=track["album"]["name"],
+            album_id=track["album"]["id"],
+            isrc=track.get("external_ids", {}).get("isrc"),
+            track_no=track.get("track_number"),
+            provider='spotify',
+            duration=track.get("duration_ms"),
+            cover_url=self._cover(track["album"].get("images"))
+        )
+
+    def _to_album(self, album: Dict) -> BaseAlbum:
+        return BaseAlbum(
+            title=album["name"],
+            album_id=album["id"],
+            artist=album["artists"][0]["name"],
+            artist_id=album["artists"][0]["id"],
+            provider='spotify',
+            upc=album.get("external_ids", {}).get("upc"),
+            tags=album.get("genres") or None,
+            cover_url=self._cover(album.get("images")),
+            track_count=album["total_tracks"]
+        )
+
+    def _to_artist(self, artist: Dict) -> BaseArtist:
+        return BaseArtist(
+            name=artist["name"],
+            artist_id=artist["id"],
+            provider='spotify',
+            tags=artist.get("genres") or None,
+            cover_url=self._cover(artist.get("images"))
+        )
+
+    async def search(self, term: str, limit: int = 1) -> BaseTrack:
+        """Search for a track, the first result is returned"""
         params = {
-            "q": query,
+            "q": term,
             "type": "track",
             "limit": limit
         }
-        
+
         response = await self._make_request("search", params)
-        return response.get("tracks", {}).get("items", [])
-    
-    async def get_album(self, album_id: str) -> Dict[str, Any]:
+        items = response.get("tracks", {}).get("items", [])
+        if not items:
+            raise MetadataNotFound(f"Track not found : {term}")
+        return self._to_track(items[0])
+
+    async def get_song_by_isrc(self, isrc: str) -> BaseTrack:
+        return await self.search(f"isrc:{isrc}")
+
+    async def get_album(self, album_id: str) -> BaseAlbum:
         """Get album by ID"""
-        return await self._make_request(f"albums/{album_id}")
-    
-    async def get_artist(self, artist_id: str) -> Dict[str, Any]:
+        album = await self.album_loader.load(album_id)
+        if not album:
+            raise MetadataNotFound(f"Album not found : {album_id}")
+        return self._to_album(album)
+
+    async def get_artist(self, artist_id: str) -> BaseArtist:
         """Get artist by ID"""
-        return await self._make_request(f"artists/{artist_id}")
\ No newline at end of file
+        artist = await self.artist_loader.load(artist_id)
+        if not artist:
+            raise MetadataNotFound(f"Artist not found : {artist_id}")
+        return self._to_artist(artist)
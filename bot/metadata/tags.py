@@ -0,0 +1,56 @@
+import io
+import mutagen
+
+from typing import Optional
+
+from .models import BaseTrack
+
+
+HEADER_SIZE = 512 * 1024  # ID3 / FLAC / Vorbis tags sit at the start of the file
+
+
+def _first(tags, key: str) -> Optional[str]:
+    values = tags.get(key)
+    return str(values[0]).strip() or None if values else None
+
+
+def parse_tags(data: bytes) -> Optional[BaseTrack]:
+    """
+    Read the embedded tags from the start of an audio file.
+    Returns None when they can't be read or have no title / artist,
+    MP4 files with the `moov` atom at the end usually end up here.
+    """
+    try:
+        audio = mutagen.File(io.BytesIO(data), easy=True)
+    except Exception:
+        return None
+    if not audio or not audio.tags:
+        return None
+
+    title = _first(audio.tags, 'title')
+    artist = _first(audio.tags, 'artist')
+    if not title or not artist:
+        return None
+
+    # "3" or "3/12"
+    track_no = _first(audio.tags, 'tracknumber')
+    try:
+        track_no = int(track_no.split('/')[0]) if track_no else None
+    except ValueError:
+        track_no = None
+
+    genres = audio.tags.get('genre')
+    return BaseTrack(
+        title=title,
+        artist=artist,
+        album=_first(audio.tags, 'album'),
+        isrc=_first(audio.tags, 'isrc'),
+        track_no=track_no,
+        tags=[str(genre) for genre in genres] if genres else None,
+        provider='tags'
+    )
+
+
+def is_complete(track: BaseTrack) -> bool:
+    """Enough to file the track without asking the provider"""
+    return bool(track.title and track.artist and track.album and track.track_no)
@@ -0,0 +1,140 @@
+import re
+import time
+import asyncio
+
+from datetime import datetime
+from typing import Optional
+
+from pyrogram import Client, filters
+from pyrogram.types import Message
+
+from .indexing import add_album, add_artist, run_once
+from ..database import artist_summaries
+from ..database.connection import mongo, COLLECTIONS
+from ..metadata.handler import meta_manager
+from ..logger import LOGGER
+from config import Config
+
+ENRICH_BATCH = 50  # tracks looked up concurrently
+# tracks without provider ids: telegram metadata, or complete tags stored without a lookup
+ENRICH_QUERY = {"provider": {"$in": ["null", "tags"]}}
+
+# provider fields copied onto a track that was indexed with telegram metadata
+PROVIDER_FIELDS = (
+    "title", "track_id", "artist", "artist_id", "album", "album_id",
+    "isrc", "track_no", "provider", "duration", "tags", "cover_url"
+)
+# copied onto a track filed from its embedded tags, the tags themselves are kept
+TAG_LINK_FIELDS = ("track_id", "artist_id", "album_id", "cover_url", "provider")
+
+
+def _same(a: Optional[str], b: Optional[str]) -> bool:
+    """Equal ignoring case, spacing and punctuation"""
+    return re.sub(r"\W+", "", (a or "").casefold()) == re.sub(r"\W+", "", (b or "").casefold())
+
+
+class Enricher:
+    def __init__(self):
+        """Upgrades tracks stored without provider metadata once the provider answers"""
+        self.task: Optional[asyncio.Task] = None
+        self.total = 0
+        self.checked = 0
+        self.upgraded = 0
+        self.started_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self.task and not self.task.done())
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self.run())
+
+    def progress(self) -> str:
+        if not self.started_at:
+            return "Re-enrichment has not run yet."
+        elapsed = time.monotonic() - self.started_at
+        rate = self.checked / elapsed if elapsed else 0
+        state = "running" if self.running else "finished"
+        return (
+            f"Re-enrichment {state}: {self.checked} / {self.total} checked, "
+            f"{self.upgraded} upgraded ({rate:.1f} tracks/s)"
+        )
+
+    async def run(self):
+        songs = mongo.db[COLLECTIONS["songs"]]
+        self.total = await songs.count_documents(ENRICH_QUERY)
+        self.checked = self.upgraded = 0
+        self.started_at = time.monotonic()
+        LOGGER.info(f"Enricher : Re-enriching {self.total} tracks")
+
+        last_id = None
+        while True:
+            query = dict(ENRICH_QUERY)
+            if last_id:
+                query["_id"] = {"$gt": last_id}
+            batch = await songs.find(query, {"title": 1, "artist": 1, "isrc": 1, "provider": 1}).sort("_id", 1).limit(ENRICH_BATCH).to_list(None)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+
+            # the provider went down again, the breaker restarts us once it is back
+            if meta_manager.breaker.state != "closed":
+                LOGGER.warning("Enricher : Provider unavailable, stopping")
+                break
+
+            results = await asyncio.gather(*(self.upgrade(doc) for doc in batch), return_exceptions=True)
+            self.checked += len(batch)
+            self.upgraded += sum(result is True for result in results)
+
+        LOGGER.info(f"Enricher : Done, {self.checked} checked, {self.upgraded} upgraded")
+
+    async def upgrade(self, doc: dict) -> bool:
+        from_tags = doc["provider"] == "tags"
+        metadata = None
+        if from_tags and doc.get("isrc"):
+            metadata = await meta_manager.get_song_by_isrc(doc["isrc"])
+        if not metadata:
+            metadata = await meta_manager.search(doc["title"], doc["artist"])
+        if metadata.provider == 'null':
+            return False
+
+        fields = PROVIDER_FIELDS
+        if from_tags:
+            # a search hit may be another recording, only link the ids when it is the tagged one
+            if not (_same(metadata.title, doc["title"]) and _same(metadata.artist, doc["artist"])):
+                return False
+            fields = TAG_LINK_FIELDS
+
+        await mongo.db[COLLECTIONS["songs"]].update_one(
+            {"_id": doc["_id"], "provider": doc["provider"]},
+            {"$set": {
+                **{field: getattr(metadata, field) for field in fields},
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        artist_summaries.mark_stale(metadata.artist_id)
+
+        tasks = []
+        if metadata.artist_id:
+            tasks.append(run_once(f"artist:{metadata.artist_id}", lambda: add_artist(metadata.artist_id, metadata.artist)))
+        if metadata.album_id:
+            tasks.append(run_once(f"album:{metadata.album_id}", lambda: add_album(metadata.album_id, metadata.album)))
+        await asyncio.gather(*tasks)
+        return True
+
+
+enricher = Enricher()
+meta_manager.breaker.on_recover = enricher.start
+
+
+@Client.on_message(filters.command("enrich"))
+async def enrich_status(client: Client, message: Message):
+    if message.from_user.id not in Config.ADMINS:
+        return
+
+    if not enricher.running:
+        enricher.start()
+        await message.reply_text("Re-enrichment of tracks without provider metadata started.")
+        return
+    await message.reply_text(enricher.progress())
@@ -1,65 +1,326 @@
+import time
+import asyncio
+
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from typing import Tuple
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from pyrogram.enums import MessageMediaType
+from pyrogram.errors import ChannelInvalid, ChannelPrivate, FloodWait, PeerIdInvalid
 
 from ..utils.queue import AsyncQueueProcessor
+from ..utils.singleflight import SingleFlight
 from ..metadata.handler import meta_manager
-from ..database import AlbumManager, ArtistManager, TrackManager
+from ..metadata.models import BaseTrack
+from ..metadata.tags import HEADER_SIZE, parse_tags
+from ..tgclient import botmanager
+from ..database import AlbumManager, ArtistManager, TrackManager, JobManager, artist_summaries
+from ..database.models import DBBackfill, DBIndexJob
 from ..logger import LOGGER
 from config import Config
 
+BACKFILL_CHUNK = 100  # messages fetched per request
+RETRY_INTERVAL = 30  # seconds between checks for jobs to retry
+FETCH_RETRIES = 3  # attempts per backfill chunk
+FETCH_BACKOFF = 2  # seconds before the first retry of a chunk, doubled after every attempt
+# the bot can't see the chat, other bots may
+ACCESS_ERRORS = (ChannelPrivate, ChannelInvalid, PeerIdInvalid)
+
+# work already running for a key, concurrent workers wait for it instead of repeating it
+_flight = SingleFlight()
+# monotonic time each client may call telegram again after a FloodWait
+_flood_until: Dict[Client, float] = {}
+
+
+async def run_once(key: str, func: Callable[[], Awaitable[None]]):
+    """Run `func` unless another worker is running it for the same key, then just wait for that"""
+    await _flight.run(key, func)
+
+
+async def add_artist(artist_id: str, artist_name: str):
+    artist_exist = await ArtistManager.check_exists(artist_id, artist_name)
+    if not artist_exist:
+        with processor.stage("metadata"):
+            artist_data = await meta_manager.get_artist(artist_id, artist_name)
+        if await ArtistManager.insert_artist(artist_data):
+            LOGGER.info(f"Artist added: '{artist_name}' (ID: {artist_id})")
+
+
+async def add_album(album_id: str, album_name: str):
+    album_exist = await AlbumManager.check_album_exists(album_id)
+    if not album_exist:
+        with processor.stage("metadata"):
+            album_data = await meta_manager.get_album(album_id)
+        if album_data and await AlbumManager.insert_album(album_data):
+            LOGGER.info(f"Album added: '{album_name}' (ID: {album_id})")
+
+
+async def read_tags(client: Client, msg: Message) -> Optional[BaseTrack]:
+    """Tags embedded in the uploaded file, read from its first part by the bot that received it"""
+    bot = botmanager.get_bot_by_client(client)
+    if not Config.READ_FILE_TAGS or not bot:
+        return None
+    try:
+        data = await bot.bytestreamer.read_head(msg.chat.id, msg.id, HEADER_SIZE)
+    except Exception as e:
+        LOGGER.debug(f"Indexing : Could not read tags of {msg.chat.id}/{msg.id} - {e}")
+        return None
+    # mutagen is pure python, keep the parsing off the event loop
+    return await asyncio.to_thread(parse_tags, data)
+
+
+async def add_track(client: Client, msg: Message):
+    audio_data = msg.audio
+
+    title = audio_data.title
+    artist = audio_data.performer
+
+    with processor.stage("lookup"):
+        song_exist = await TrackManager.check_exists(
+            audio_data.file_unique_id
+        )
+    if song_exist:
+        return
+
+    with processor.stage("tags"):
+        tags = await read_tags(client, msg)
+
+    with processor.stage("metadata"):
+        metadata = await meta_manager.identify(title, artist, tags)
+
+    metadata.chat_id = msg.chat.id
+    metadata.msg_id = msg.id
+    metadata.file_unique_id = audio_data.file_unique_id
+    metadata.mime_type = audio_data.mime_type
+    metadata.file_size = audio_data.file_size
+    metadata.file_name = audio_data.file_name
+    if not metadata.duration and audio_data.duration:
+        metadata.duration = audio_data.duration * 1000
+
+
+    with processor.stage("database"):
+        inserted = await TrackManager.insert_track(metadata)
+    if not inserted:
+        return
+    LOGGER.info(f"Track added: '{metadata.title}' by '{metadata.artist}' (ID: {metadata.track_id or metadata.file_unique_id})")
+    artist_summaries.mark_stale(metadata.artist_id)
+
+    tasks = []
+    if metadata.artist_id:
+        tasks.append(run_once(f"artist:{metadata.artist_id}", lambda: add_artist(metadata.artist_id, metadata.artist)))
+    if metadata.album_id:
+        tasks.append(run_once(f"album:{metadata.album_id}", lambda: add_album(metadata.album_id, metadata.album)))
+    await asyncio.gather(*tasks)
+
+
+def is_new_track(msg: Message) -> bool:
+    """An audio message whose file is not indexed yet, anything else never becomes a job"""
+    return msg.media == MessageMediaType.AUDIO and not TrackManager.is_known(msg.audio.file_unique_id)
+
+
 async def handle_tracks(data: Tuple[Client, Message]):
     c, msg = data
 
     if msg.media == MessageMediaType.AUDIO:
         audio_data = msg.audio
-        
-        title = audio_data.title
-        artist = audio_data.performer
+        await run_once(f"track:{audio_data.file_unique_id}", lambda: add_track(c, msg))
 
-        song_exist = await TrackManager.check_exists(
-            audio_data.file_unique_id
+
+async def index_message(data: Tuple[Client, Message]):
+    """Index a message and settle its stored job"""
+    c, msg = data
+    try:
+        await handle_tracks(data)
+    except Exception as e:
+        await JobManager.failed(msg.chat.id, msg.id, str(e))
+        raise
+    await JobManager.done(msg.chat.id, msg.id)
+
+
+processor = AsyncQueueProcessor(index_message, concurrency=Config.INDEX_WORKERS, max_size=Config.INDEX_QUEUE_SIZE)
+
+
+async def get_messages(client: Client, chat_id: Union[int, str], msg_ids: List[int]) -> List[Message]:
+    """Fetch existing messages, waiting out flood limits of this client only"""
+    while True:
+        wait = _flood_until.get(client, 0) - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            messages = await client.get_messages(chat_id, msg_ids)
+            return [msg for msg in messages if msg and not msg.empty]
+        except FloodWait as e:
+            # concurrent fetches on the same client wait too instead of hitting it again
+            _flood_until[client] = max(_flood_until.get(client, 0), time.monotonic() + e.value + 1)
+
+
+async def queue_messages(client: Client, chat_id: Union[int, str], msg_ids: List[int]) -> int:
+    """
+    Fetch messages, record them as jobs, then queue them.
+    Files already indexed are dropped here, a rescan of a known channel writes nothing.
+    Returns:
+        No. of messages queued
+    """
+    messages = [msg for msg in await get_messages(client, chat_id, msg_ids) if is_new_track(msg)]
+    if messages:
+        await JobManager.enqueue(messages[0].chat.id, [msg.id for msg in messages])
+    for msg in messages:
+        await processor.add_item((client, msg))
+    return len(messages)
+
+
+def backfill_clients(client: Client) -> List[Client]:
+    """Clients of every running bot, `client` alone when there are no others"""
+    clients = [bot.client for bot in botmanager.get_all_bots() if bot.is_running]
+    return clients or [client]
+
+
+async def run_backfill(clients: List[Client], backfill: DBBackfill, on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> Tuple[int, int]:
+    """
+    Queue a range of messages, continuing from the saved position.
+    Chunks are fetched by all `clients` at once, each waiting out its own flood limits.
+    The saved position only moves past chunks that are done with every chunk before them,
+    a backfill with failed chunks is left unfinished to be resumed.
+    Returns the messages queued and the chunks that failed.
+    """
+    total = backfill.end_msg_id - backfill.start_msg_id + 1
+    positions = list(range(backfill.position, backfill.end_msg_id + 1, BACKFILL_CHUNK))
+    pending: asyncio.Queue = asyncio.Queue()
+    for position in positions:
+        pending.put_nowait(position)
+
+    finished: Dict[int, int] = {}  # chunk start -> messages queued, until the saved position passes it
+    failed: List[int] = []  # chunk starts
+    saved_index, saved_queued = 0, backfill.queued  # chunks below the saved position
+    done = backfill.position - backfill.start_msg_id
+    queued = backfill.queued
+    settled = 0
+    fetchers = len(clients) * Config.INDEX_FETCHES_PER_BOT
+    alive = fetchers
+
+    def settle():
+        nonlocal settled
+        settled += 1
+        if settled == len(positions):
+            for _ in range(fetchers):
+                pending.put_nowait(None)
+
+    async def complete(position: int, count: int):
+        nonlocal done, queued, saved_index, saved_queued
+        finished[position] = count
+        done += min(BACKFILL_CHUNK, backfill.end_msg_id + 1 - position)
+        queued += count
+        settle()
+
+        advanced = False
+        while saved_index < len(positions) and positions[saved_index] in finished:
+            saved_queued += finished.pop(positions[saved_index])
+            saved_index += 1
+            advanced = True
+        if advanced:
+            next_position = positions[saved_index] if saved_index < len(positions) else backfill.end_msg_id + 1
+            await JobManager.checkpoint(backfill.id, next_position, saved_queued)
+        if on_progress:
+            await on_progress(done, total)
+
+    async def fetch(client: Client, chunk: List[int]) -> int:
+        for attempt in range(FETCH_RETRIES):
+            try:
+                return await queue_messages(client, backfill.chat_id, chunk)
+            except ACCESS_ERRORS:
+                raise
+            except Exception as e:
+                if attempt == FETCH_RETRIES - 1:
+                    raise
+                delay = FETCH_BACKOFF * 2 ** attempt
+                LOGGER.warning(f"Indexing : Fetching chunk {chunk[0]}-{chunk[-1]} failed, retrying in {delay}s - {e}")
+                await asyncio.sleep(delay)
+
+    async def fetcher(client: Client):
+        nonlocal alive
+        while (position := await pending.get()) is not None:
+            chunk = list(range(position, min(position + BACKFILL_CHUNK, backfill.end_msg_id + 1)))
+            try:
+                count = await fetch(client, chunk)
+            except ACCESS_ERRORS as e:
+                # leave the chunks of a bot that can't see the chat to the others
+                if alive > 1:
+                    LOGGER.warning(f"Indexing : {client.name} left the backfill of {backfill.chat_id} - {e}")
+                    alive -= 1
+                    pending.put_nowait(position)
+                    return
+                LOGGER.error(f"Indexing : No bot can fetch chunk {chunk[0]}-{chunk[-1]} - {e}")
+                failed.append(position)
+                settle()
+                continue
+            except Exception as e:
+                LOGGER.error(f"Indexing : Error fetching chunk {chunk[0]}-{chunk[-1]} - {e}")
+                failed.append(position)
+                settle()
+                continue
+            await complete(position, count)
+
+    if positions:
+        await asyncio.gather(*(
+            fetcher(client) for client in clients for _ in range(Config.INDEX_FETCHES_PER_BOT)
+        ))
+
+    if failed:
+        LOGGER.warning(
+            f"Indexing : {len(failed)} chunks of the backfill of {backfill.chat_id} failed, "
+            f"it resumes from message {min(failed)} on the next start"
         )
-        if song_exist:
-            return
-
-        metadata = await meta_manager.search(title, artist)
-
-        metadata.chat_id = msg.chat.id
-        metadata.msg_id = msg.id
-        metadata.file_unique_id = audio_data.file_unique_id
-        metadata.mime_type = audio_data.mime_type
-        metadata.file_size = audio_data.file_size
-        metadata.file_name = audio_data.file_name
-
-
-        await TrackManager.insert_track(metadata)
-        LOGGER.info(f"Track added: '{metadata.title}' by '{metadata.artist}' (ID: {metadata.track_id or metadata.file_unique_id})")
-
-        if metadata.artist_id:
-            artist_exist = await ArtistManager.check_exists(
-                metadata.artist_id, metadata.artist
-            )
-            if not artist_exist:
-                artist_data = await meta_manager.get_artist(
-                    metadata.artist_id, metadata.artist
-                )
-                await ArtistManager.insert_artist(artist_data)
-                LOGGER.info(f"Artist added: '{metadata.artist}' (ID: {metadata.artist_id})")
-        
-        if metadata.album_id:
-            album_exist = await AlbumManager.check_album_exists(metadata.album_id)
-            if not album_exist:
-                album_data = await meta_manager.get_album(metadata.album_id)
-                await AlbumManager.insert_album(album_data)
-                LOGGER.info(f"Album added: '{metadata.album}' (ID: {metadata.album_id})")
-
-
-processor = AsyncQueueProcessor(handle_tracks)
+    else:
+        await JobManager.finish_backfill(backfill.id)
+    return queued, len(failed)
+
+
+async def retry_jobs(client: Client):
+    while True:
+        await asyncio.sleep(RETRY_INTERVAL)
+        try:
+            await queue_jobs(client, await JobManager.claim_due())
+        except Exception as e:
+            LOGGER.error(f"Indexing : Retrying jobs failed - {e}")
+
+
+async def queue_jobs(client: Client, jobs: List[DBIndexJob]):
+    by_chat: Dict[int, List[int]] = {}
+    for job in jobs:
+        by_chat.setdefault(job.chat_id, []).append(job.msg_id)
+
+    for chat_id, msg_ids in by_chat.items():
+        for i in range(0, len(msg_ids), BACKFILL_CHUNK):
+            chunk = msg_ids[i : i + BACKFILL_CHUNK]
+            messages = [msg for msg in await get_messages(client, chat_id, chunk) if is_new_track(msg)]
+            # deleted or indexed since, nothing left to do
+            found = {msg.id for msg in messages}
+            for msg_id in chunk:
+                if msg_id not in found:
+                    await JobManager.done(chat_id, msg_id)
+            for msg in messages:
+                await processor.add_item((client, msg))
+
+
+async def resume_indexing(client: Client):
+    """Requeue jobs and backfills left over from the last run, then keep retrying failed jobs"""
+    try:
+        jobs = await JobManager.get_queued()
+        if jobs:
+            LOGGER.info(f"Indexing : Resuming {len(jobs)} queued messages")
+            await queue_jobs(client, jobs)
+
+        for backfill in await JobManager.get_backfills():
+            LOGGER.info(f"Indexing : Resuming backfill of {backfill.chat_id} from message {backfill.position}")
+            await run_backfill(backfill_clients(client), backfill)
+    except Exception as e:
+        LOGGER.error(f"Indexing : Resume failed - {e}")
+
+    await retry_jobs(client)
+
 
 @Client.on_message(filters.audio | filters.document)
 async def handle_music(c: Client, msg: Message):
-    if msg.chat.id not in Config.MUSIC_CHANNELS:
+    if msg.chat.id not in Config.MUSIC_CHANNELS or not is_new_track(msg):
         return
-    await processor.add_item((c, msg))
\ No newline at end of file
+    await JobManager.enqueue(msg.chat.id, [msg.id])
+    await processor.add_item((c, msg))
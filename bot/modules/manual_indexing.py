@@ -1,10 +1,14 @@
-import asyncio
-from typing import Tuple, List, Union
+import time
+
+from typing import Tuple, Union
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.errors import MessageNotModified
+
+from .indexing import backfill_clients, run_backfill
+from ..database import JobManager
 
-from .indexing import processor
+PROGRESS_INTERVAL = 5  # seconds between progress edits
 
 def get_link_info(link: str) -> Tuple[Union[str, int], int]:
     if "?" in link:
@@ -47,41 +51,36 @@ async def manual_indexing(client: Client, message: Message):
             start_msg_id, end_msg_id = end_msg_id, start_msg_id
 
         total_messages = end_msg_id - start_msg_id + 1
-        status_msg = await message.reply_text(f"Indexing {total_messages} messages...")
-        
-        chunk_size = 100
-        msg_ids_to_fetch = list(range(start_msg_id, end_msg_id + 1))
-        
-        indexed_count = 0
+        clients = backfill_clients(client)
+        status_msg = await message.reply_text(f"Indexing {total_messages} messages with {len(clients)} bots...")
+
+        started_at = time.monotonic()
+        last_edit = 0.0
+
+        async def show_progress(done: int, total: int):
+            nonlocal last_edit
+            now = time.monotonic()
+            if now - last_edit < PROGRESS_INTERVAL and done != total:
+                return
+            last_edit = now
+            rate = done / (now - started_at) if now > started_at else 0
+            eta = f"{int((total - done) / rate)}s" if rate else "-"
+            try:
+                await status_msg.edit_text(f"Processed: {done} / {total}\n{rate:.0f} messages/s, ETA {eta}")
+            except MessageNotModified:
+                pass
 
-        for i in range(0, len(msg_ids_to_fetch), chunk_size):
-            chunk = msg_ids_to_fetch[i : i + chunk_size]
-            
-            retry = True
-            while retry:
-                try:
-                    messages: List[Message] = await client.get_messages(start_chat, chunk)
-                    retry = False # Success
-                    
-                    for msg in messages:
-                        if not msg or msg.empty:
-                            continue
-                        
-                        await processor.add_item((client, msg))
-                        indexed_count += 1
-                        
-                except FloodWait as e:
-                    await asyncio.sleep(e.value + 1)
-                except Exception as e:
-                    print(f"Error fetching chunk {chunk}: {e}")
-                    retry = False # Skip this chunk on other errors
-            if i % 500 == 0:
-                 try:
-                    await status_msg.edit_text(f"Processed: {i + len(chunk)} / {total_messages}")
-                 except MessageNotModified:
-                     pass
+        # saved first, a restart resumes the backfill from its last finished chunk
+        backfill = await JobManager.create_backfill(start_chat, start_msg_id, end_msg_id)
+        indexed_count, failed_chunks = await run_backfill(clients, backfill, show_progress)
 
-        await status_msg.edit_text(f"Indexing completed. Queued {indexed_count} messages.")
+        if failed_chunks:
+            await status_msg.edit_text(
+                f"Indexing incomplete, {failed_chunks} chunks could not be fetched. "
+                f"Queued {indexed_count} messages, the rest is retried on the next start."
+            )
+        else:
+            await status_msg.edit_text(f"Indexing completed. Queued {indexed_count} messages.")
 
     except ValueError:
         await message.reply_text("Invalid link provided.")
@@ -1,8 +1,20 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from .indexing import processor
+from ..database import JobManager
+from ..utils.auth import hasher
 
 @Client.on_message(filters.command("queue"))
 async def queue_status(client: Client, message: Message):
-    size = processor.queue.qsize()
-    await message.reply_text(f"Queue size: {size}")
+    indexing = processor.stats()
+    hashing = hasher.stats()
+    jobs = await JobManager.count_by_state()
+    stages = ", ".join(f"{name} {ms:.0f}ms" for name, ms in indexing["stages"].items())
+    await message.reply_text(
+        f"Queue size: {indexing['queued']} ({indexing['workers']} workers)\n"
+        f"Indexed: {indexing['processed']} processed, {indexing['failed']} failed\n"
+        f"Avg time per stage: {stages or '-'}\n"
+        f"Jobs: {jobs.get('queued', 0)} queued, {jobs.get('retry', 0)} waiting to retry, {jobs.get('failed', 0)} failed\n"
+        f"Password hashing: {hashing['running']}/{hashing['workers']} running, "
+        f"{hashing['queued']} queued, {hashing['rejected']} rejected"
+    )
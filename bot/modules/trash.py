@@ -0,0 +1,46 @@
+from pyrogram import Client, filters
+from pyrogram.types import Message
+
+from ..database import TrashManager, artist_summaries
+from ..utils.streamer import dead_messages
+from config import Config
+
+@Client.on_message(filters.command("trash"))
+async def list_trash(client: Client, message: Message):
+    if message.from_user.id not in Config.ADMINS:
+        return
+
+    items = await TrashManager.get_pending()
+    if not items:
+        await message.reply_text("Trash is empty.")
+        return
+
+    lines = [
+        f"`{item.id}` - {item.original_song_data.get('title')} ({item.reason})"
+        for item in items
+    ]
+    await message.reply_text("Pending trash:\n" + "\n".join(lines) + "\n\nRestore with /restore <id>")
+
+
+@Client.on_message(filters.command("restore"))
+async def restore_trash(client: Client, message: Message):
+    if message.from_user.id not in Config.ADMINS:
+        return
+
+    if len(message.command) < 2:
+        await message.reply_text("Usage: /restore <trash_id>")
+        return
+
+    item = await TrashManager.restore(message.command[1])
+    if not item:
+        await message.reply_text("No pending trash entry with that id.")
+        return
+
+    dead_messages.pop_where(lambda key: key[1:] == (item.chat_id, item.msg_id))
+    artist_summaries.mark_stale(item.original_song_data.get("artist_id"))
+    if item.status == "reindexed":
+        await message.reply_text(
+            f"Already indexed again: {item.original_song_data.get('title')}. The trash entry was closed."
+        )
+        return
+    await message.reply_text(f"Restored: {item.original_song_data.get('title')}")
@@ -1,6 +1,7 @@
 from typing import List
-from pydantic import BaseModel
-from ..database.models import DBAlbum, DBArtist, DBTrack
+from pydantic import BaseModel, Field, field_validator
+from ..database.models import DBAlbum, DBArtist, DBTrack, DBPlaylist
+from config import Config
 
 
 class UserLogin(BaseModel):
@@ -33,4 +34,58 @@ class AlbumWithTracks(DBAlbum):
 
 class ArtistDetailed(DBArtist):
     albums: List[DBAlbum] = []
-    tracks: List[DBTrack] = []
\ No newline at end of file
+    tracks: List[DBTrack] = []
+    popular_tracks: List[DBTrack] = []
+    recent_tracks: List[DBTrack] = []
+
+
+class PlaylistCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    is_public: bool = False
+
+
+class PlaylistTracks(BaseModel):
+    song_ids: List[str] = Field(..., min_length=1, max_length=Config.BATCH_LIMIT)
+
+
+class PlaylistWithTracks(DBPlaylist):
+    tracks: List[DBTrack] = []
+
+
+class PlaylistUpdate(BaseModel):
+    track_count: int
+    duration: int
+    missing: List[str] = []
+
+
+class SyncResponse(BaseModel):
+    tracks: List[DBTrack] = []
+    albums: List[DBAlbum] = []
+    artists: List[DBArtist] = []
+    trashed: List[str] = []  # `_id` of songs removed from the library
+    checkpoint: str  # pass back as `checkpoint` for the next batch
+    has_more: bool = False
+
+
+class BatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=Config.BATCH_LIMIT)
+
+    @field_validator("ids")
+    @classmethod
+    def dedupe(cls, ids: List[str]) -> List[str]:
+        return list(dict.fromkeys(ids))
+
+
+class TrackBatch(BaseModel):
+    items: List[DBTrack] = []
+    missing: List[str] = []
+
+
+class AlbumBatch(BaseModel):
+    items: List[DBAlbum] = []
+    missing: List[str] = []
+
+
+class ArtistBatch(BaseModel):
+    items: List[DBArtist] = []
+    missing: List[str] = []
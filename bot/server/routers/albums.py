@@ -3,21 +3,43 @@ from fastapi import APIRouter, HTTPException
 
 from ...database.connection import mongo
 from ...database.models import DBAlbum, DBTrack
-from ..models import AlbumWithTracks
-from ...utils.web import paginate
+from ...database.catalogue import catalogue
+from ..models import AlbumWithTracks, AlbumBatch, BatchRequest
+from ...utils.web import paginate, order_by_ids, FastJSONResponse
 
 router = APIRouter()
 
 @router.get("/albums", response_model=List[DBAlbum])
 async def get_albums(limit: int = 10, page: int = 1):
     paging = paginate(limit, page)
+    if catalogue.ready:
+        return FastJSONResponse(catalogue.get_albums(paging["skip"], paging["limit"]))
+
     cursor = mongo.db["albums"].find().skip(paging["skip"]).limit(paging["limit"])
     results = [DBAlbum(**album) async for album in cursor]
-    return results
+    return FastJSONResponse(results)
+
+
+@router.post("/albums/batch", response_model=AlbumBatch)
+async def get_albums_batch(batch: BatchRequest):
+    if catalogue.ready:
+        albums, missing = catalogue.get_albums_batch(batch.ids)
+        return FastJSONResponse(AlbumBatch(items=albums, missing=missing))
+
+    cursor = mongo.db["albums"].find({"album_id": {"$in": batch.ids}})
+    albums, missing = order_by_ids([doc async for doc in cursor], batch.ids, "album_id")
+    return FastJSONResponse(AlbumBatch(items=[DBAlbum(**album) for album in albums], missing=missing))
 
 
 @router.get("/albums/{id}", response_model=AlbumWithTracks)
 async def get_album(id: str):
+    if catalogue.ready:
+        album = catalogue.get_album(id)
+        if not album:
+            raise HTTPException(status_code=404, detail="Album not found")
+        tracks = catalogue.get_album_tracks(id)
+        return FastJSONResponse(AlbumWithTracks(**album.dict(by_alias=True), tracks=tracks))
+
     album = await mongo.db["albums"].find_one({"album_id": id})
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
@@ -25,4 +47,4 @@ async def get_album(id: str):
     tracks_cursor = mongo.db["songs"].find({"album_id": id})
     tracks = [DBTrack(**track) async for track in tracks_cursor]
     
-    return AlbumWithTracks(**album, tracks=tracks)
+    return FastJSONResponse(AlbumWithTracks(**album, tracks=tracks))
@@ -2,36 +2,60 @@ from typing import List
 from fastapi import APIRouter, HTTPException
 
 from ...database.connection import mongo
-from ...database.models import DBArtist, DBAlbum, DBTrack
-from ..models import ArtistDetailed
-from ...utils.web import paginate
+from ...database.models import DBArtist, DBAlbum
+from ...database.summary import artist_summaries
+from ...database.catalogue import catalogue
+from ..models import ArtistDetailed, ArtistBatch, BatchRequest
+from ...utils.web import paginate, order_by_ids, FastJSONResponse
 
 router = APIRouter()
 
 @router.get("/artists", response_model=List[DBArtist])
 async def get_artists(limit: int = 10, page: int = 1):
     paging = paginate(limit, page)
+    if catalogue.ready:
+        return FastJSONResponse(catalogue.get_artists(paging["skip"], paging["limit"]))
+
     cursor = mongo.db["artists"].find().skip(paging["skip"]).limit(paging["limit"])
     results = [DBArtist(**artist) async for artist in cursor]
-    return results
+    return FastJSONResponse(results)
+
+
+@router.post("/artists/batch", response_model=ArtistBatch)
+async def get_artists_batch(batch: BatchRequest):
+    if catalogue.ready:
+        artists, missing = catalogue.get_artists_batch(batch.ids)
+        return FastJSONResponse(ArtistBatch(items=artists, missing=missing))
+
+    cursor = mongo.db["artists"].find({"artist_id": {"$in": batch.ids}})
+    artists, missing = order_by_ids([doc async for doc in cursor], batch.ids, "artist_id")
+    return FastJSONResponse(ArtistBatch(items=[DBArtist(**artist) for artist in artists], missing=missing))
 
 
 @router.get("/artists/{id}", response_model=ArtistDetailed)
 async def get_artist(id: str):
-    artist = await mongo.db["artists"].find_one({"artist_id": id})
-    if not artist:
-        raise HTTPException(status_code=404, detail="Artist not found")
-    
-    # Fetch all albums
-    albums_cursor = mongo.db["albums"].find({"artist_id": id})
-    albums = [DBAlbum(**album) async for album in albums_cursor]
+    if catalogue.ready:
+        artist = catalogue.get_artist(id)
+        if not artist:
+            raise HTTPException(status_code=404, detail="Artist not found")
+        artist = artist.dict(by_alias=True)
+        albums = catalogue.get_artist_albums(id)
+    else:
+        artist = await mongo.db["artists"].find_one({"artist_id": id})
+        if not artist:
+            raise HTTPException(status_code=404, detail="Artist not found")
+
+        # Fetch all albums
+        albums_cursor = mongo.db["albums"].find({"artist_id": id})
+        albums = [DBAlbum(**album) async for album in albums_cursor]
     
-    # Fetch 10 random tracks
-    pipeline = [
-        {"$match": {"artist_id": id}},
-        {"$sample": {"size": 10}}
-    ]
-    tracks_cursor = mongo.db["songs"].aggregate(pipeline)
-    tracks = [DBTrack(**track) async for track in tracks_cursor]
-
-    return ArtistDetailed(**artist, albums=albums, tracks=tracks)
+    # Precomputed track picks (shuffled, popular and recent)
+    summary = await artist_summaries.get(id)
+
+    return FastJSONResponse(ArtistDetailed(
+        **artist,
+        albums=albums,
+        tracks=summary.shuffled,
+        popular_tracks=summary.popular,
+        recent_tracks=summary.recent
+    ))
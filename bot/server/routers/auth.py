@@ -12,7 +12,7 @@ router = APIRouter()
 async def register(user: UserRegister):
     if await mongo.db["users"].find_one({"username": user.username}):
         raise HTTPException(status_code=400, detail="Username already exists")
-    hashed = hash_password(user.password)
+    hashed = await hash_password(user.password)
     new_user = DBUser(username=user.username, email=user.email, password_hash=hashed)
     await mongo.db["users"].insert_one(new_user.dict(by_alias=True))
     return {"message": "Registered successfully"}
@@ -24,7 +24,7 @@ async def login(user: UserLogin, response: Response):
     if not db_user:
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
-    if not verify_password(user.password, db_user["password_hash"]):
+    if not await verify_password(user.password, db_user["password_hash"]):
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
     token = create_access_token({"sub": db_user["username"]})
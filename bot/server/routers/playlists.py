@@ -0,0 +1,191 @@
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Depends
+from pymongo import ReturnDocument
+
+from ...database.connection import mongo
+from ...database.models import DBPlaylist, DBTrack
+from ...utils.auth import get_current_user, invalidate_user
+from ...utils.web import paginate, parse_object_ids, order_by_ids, FastJSONResponse
+from ..models import GenericResponse, PlaylistCreate, PlaylistTracks, PlaylistWithTracks, PlaylistUpdate
+
+router = APIRouter()
+
+
+async def hydrate_tracks(song_ids: List[ObjectId]) -> List[DBTrack]:
+    """Resolve song references with one query, keeping their order. Trashed songs are left out until restored"""
+    if not song_ids:
+        return []
+    cursor = mongo.db["songs"].find({"_id": {"$in": list(set(song_ids))}})
+    songs, _ = order_by_ids([doc async for doc in cursor], song_ids, "_id")
+    return [DBTrack(**song) for song in songs]
+
+
+async def get_song_durations(song_ids: List[ObjectId]) -> dict:
+    cursor = mongo.db["songs"].find({"_id": {"$in": song_ids}}, {"duration": 1})
+    return {doc["_id"]: doc.get("duration") or 0 async for doc in cursor}
+
+
+REMOVE_ATTEMPTS = 5  # concurrent edits retried before giving up
+
+
+def playlist_id(id: str) -> ObjectId:
+    return parse_object_ids([id])[0]
+
+
+@router.get("/playlists", response_model=List[DBPlaylist])
+async def get_playlists(limit: int = 10, page: int = 1, current_user = Depends(get_current_user)):
+    paging = paginate(limit, page)
+    # song ids are left out, `track_count` is enough for listings
+    cursor = mongo.db["playlists"].find({"user_id": current_user["_id"]}, {"song_ids": 0, "song_durations": 0}) \
+        .sort("created_at", -1).skip(paging["skip"]).limit(paging["limit"])
+    results = [DBPlaylist(**playlist) async for playlist in cursor]
+    return FastJSONResponse(results)
+
+
+@router.post("/playlists", response_model=DBPlaylist)
+async def create_playlist(data: PlaylistCreate, current_user = Depends(get_current_user)):
+    now = datetime.utcnow()
+    playlist = {
+        "name": data.name,
+        "user_id": current_user["_id"],
+        "song_ids": [],
+        "song_durations": [],  # duration of each entry in song_ids, removals stay exact after a song is trashed
+        "is_public": data.is_public,
+        "track_count": 0,
+        "duration": 0,
+        "created_at": now,
+        "updated_at": now
+    }
+    result = await mongo.db["playlists"].insert_one(playlist)
+    await mongo.db["users"].update_one(
+        {"_id": current_user["_id"]}, {"$push": {"playlists": result.inserted_id}}
+    )
+    invalidate_user(current_user["username"])
+    return FastJSONResponse(DBPlaylist(**playlist))
+
+
+@router.get("/playlists/{id}", response_model=PlaylistWithTracks)
+async def get_playlist(id: str, limit: int = 50, page: int = 1, current_user = Depends(get_current_user)):
+    paging = paginate(limit, page)
+    # only the requested page of song ids leaves the database
+    playlist = await mongo.db["playlists"].find_one(
+        {"_id": playlist_id(id)},
+        {"song_ids": {"$slice": [paging["skip"], paging["limit"]]}, "song_durations": 0}
+    )
+    if not playlist or (playlist["user_id"] != current_user["_id"] and not playlist.get("is_public")):
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    tracks = await hydrate_tracks(playlist["song_ids"])
+    return FastJSONResponse(PlaylistWithTracks(**playlist, tracks=tracks))
+
+
+@router.delete("/playlists/{id}", response_model=GenericResponse)
+async def delete_playlist(id: str, current_user = Depends(get_current_user)):
+    _id = playlist_id(id)
+    result = await mongo.db["playlists"].delete_one({"_id": _id, "user_id": current_user["_id"]})
+    if not result.deleted_count:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    await mongo.db["users"].update_one({"_id": current_user["_id"]}, {"$pull": {"playlists": _id}})
+    invalidate_user(current_user["username"])
+    return {"message": "Playlist deleted"}
+
+
+@router.post("/playlists/{id}/tracks", response_model=PlaylistUpdate)
+async def add_playlist_tracks(id: str, data: PlaylistTracks, current_user = Depends(get_current_user)):
+    song_ids = parse_object_ids(data.song_ids)
+    durations = await get_song_durations(song_ids)
+
+    found = [_id for _id in song_ids if _id in durations]
+    missing = [str(_id) for _id in song_ids if _id not in durations]
+
+    playlist = await mongo.db["playlists"].find_one_and_update(
+        {"_id": playlist_id(id), "user_id": current_user["_id"]},
+        {
+            "$push": {"song_ids": {"$each": found}, "song_durations": {"$each": [durations[_id] for _id in found]}},
+            "$inc": {"track_count": len(found), "duration": sum(durations[_id] for _id in found)},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        projection={"track_count": 1, "duration": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not playlist:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    return PlaylistUpdate(track_count=playlist["track_count"], duration=playlist["duration"], missing=missing)
+
+
+@router.post("/playlists/{id}/tracks/remove", response_model=PlaylistUpdate)
+async def remove_playlist_tracks(id: str, data: PlaylistTracks, current_user = Depends(get_current_user)):
+    _id = playlist_id(id)
+    song_ids = parse_object_ids(data.song_ids)
+
+    remove = set(song_ids)
+    for _ in range(REMOVE_ATTEMPTS):
+        playlist = await mongo.db["playlists"].find_one(
+            {"_id": _id, "user_id": current_user["_id"]}, {"song_ids": 1, "song_durations": 1}
+        )
+        if not playlist:
+            raise HTTPException(status_code=404, detail="Playlist not found")
+
+        durations = playlist.get("song_durations") or []
+        kept = [
+            (song_id, durations[i] if i < len(durations) else 0)
+            for i, song_id in enumerate(playlist["song_ids"]) if song_id not in remove
+        ]
+        kept_ids = [song_id for song_id, _ in kept]
+        kept_durations = [duration for _, duration in kept]
+
+        # only applied if nobody changed the tracks since they were read, otherwise read again
+        result = await mongo.db["playlists"].update_one(
+            {"_id": _id, "user_id": current_user["_id"], "song_ids": playlist["song_ids"]},
+            {"$set": {
+                "song_ids": kept_ids,
+                "song_durations": kept_durations,
+                "track_count": len(kept_ids),
+                "duration": sum(kept_durations),
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        if result.matched_count:
+            break
+    else:
+        raise HTTPException(status_code=409, detail="Playlist is being edited, try again")
+
+    present = set(playlist["song_ids"])
+    missing = [str(song_id) for song_id in song_ids if song_id not in present]
+    return PlaylistUpdate(track_count=len(kept_ids), duration=sum(kept_durations), missing=missing)
+
+
+@router.get("/liked", response_model=List[DBTrack])
+async def get_liked_songs(limit: int = 50, page: int = 1, current_user = Depends(get_current_user)):
+    paging = paginate(limit, page)
+    cursor = mongo.db["liked_songs"].find({"user_id": current_user["_id"]}, {"song_id": 1}) \
+        .sort("created_at", -1).skip(paging["skip"]).limit(paging["limit"])
+    song_ids = [doc["song_id"] async for doc in cursor]
+    return FastJSONResponse(await hydrate_tracks(song_ids))
+
+
+@router.post("/liked/{song_id}", response_model=GenericResponse)
+async def like_song(song_id: str, current_user = Depends(get_current_user)):
+    _id = parse_object_ids([song_id])[0]
+    if not await mongo.db["songs"].find_one({"_id": _id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Song not found")
+
+    now = datetime.utcnow()
+    await mongo.db["liked_songs"].update_one(
+        {"user_id": current_user["_id"], "song_id": _id},
+        {"$setOnInsert": {"created_at": now, "updated_at": now}},
+        upsert=True
+    )
+    return {"message": "Song liked"}
+
+
+@router.delete("/liked/{song_id}", response_model=GenericResponse)
+async def unlike_song(song_id: str, current_user = Depends(get_current_user)):
+    _id = parse_object_ids([song_id])[0]
+    await mongo.db["liked_songs"].delete_one({"user_id": current_user["_id"], "song_id": _id})
+    return {"message": "Song removed from liked songs"}
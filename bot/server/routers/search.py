@@ -5,7 +5,8 @@ import re
 
 from ...database.connection import mongo
 from ...database.models import DBTrack, DBAlbum, DBArtist
-from ...utils.web import paginate
+from ...database.catalogue import catalogue
+from ...utils.web import paginate, FastJSONResponse
 
 router = APIRouter()
 
@@ -44,10 +45,18 @@ async def search_everything(
     response = SearchResponse()
     
     if not regex:
-        return response
+        return FastJSONResponse(response)
 
     paging = paginate(limit, page)
 
+    if catalogue.ready:
+        if type in ["all", "track"]:
+            response.tracks = catalogue.search_songs(regex, paging["skip"], paging["limit"])
+        if type in ["all", "album"]:
+            response.albums = catalogue.search_albums(regex, paging["skip"], paging["limit"])
+        if type in ["all", "artist"]:
+            response.artists = catalogue.search_artists(regex, paging["skip"], paging["limit"])
+        return FastJSONResponse(response)
 
     # We can run these concurrently, but for simplicity/safety with motor/asyncio loop 
     # and connection pool, sequential await is fine for this scale.
@@ -77,4 +86,4 @@ async def search_everything(
         ).skip(paging["skip"]).limit(paging["limit"])
         response.artists = [DBArtist(**doc) async for doc in cursor]
 
-    return response
+    return FastJSONResponse(response)
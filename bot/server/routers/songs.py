@@ -1,27 +1,95 @@
-from typing import List
+import time
+
+from typing import List, Tuple
 from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.responses import StreamingResponse
+from pyrogram.file_id import FileId
 
 from ...database.connection import mongo
 from ...database.models import DBTrack
-from ...utils.web import paginate, parse_range_header
-from ...tgclient import botmanager
+from ...database.catalogue import catalogue
+from ...database.summary import artist_summaries
+from ...database.trash import TrashManager
+from ..models import BatchRequest, TrackBatch
+from ...utils.web import paginate, parse_range_header, order_by_ids, FastJSONResponse
+from ...tgclient import Bot, botmanager
+from ...utils.cache import TTLCache
+from ...utils.errors import FileNotFound
 
 router = APIRouter()
 
+PLAY_PROBE_BYTES = 64 * 1024  # ranges up to this size are players probing the file, not playback
+MISSING_CONFIRM_AFTER = 30 * 60  # seconds a message must keep missing before only the main bot's word trashes it
+
+# (chat_id, msg_id) -> monotonic time the message was first found missing
+_first_missing = TTLCache(maxsize=10000, ttl=24 * 60 * 60)
+
 @router.get("/songs", response_model=List[DBTrack])
 async def get_songs(limit: int = 10, page: int = 1):
     paging = paginate(limit, page)
+    if catalogue.ready:
+        return FastJSONResponse(catalogue.get_songs(paging["skip"], paging["limit"]))
+
     cursor = mongo.db["songs"].find().skip(paging["skip"]).limit(paging["limit"])
     results = [DBTrack(**song) async for song in cursor]
-    return results
+    return FastJSONResponse(results)
 
 @router.get("/songs/{id}", response_model=DBTrack)
 async def get_song(id: str):
+    if catalogue.ready:
+        song = catalogue.get_song(id)
+        if not song:
+            raise HTTPException(status_code=404, detail="Song not found")
+        return FastJSONResponse(song)
+
     song = await mongo.db["songs"].find_one({"track_id": id})
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
-    return DBTrack(**song)
+    return FastJSONResponse(DBTrack(**song))
+
+
+@router.post("/songs/batch", response_model=TrackBatch)
+async def get_songs_batch(batch: BatchRequest):
+    if catalogue.ready:
+        songs, missing = catalogue.get_songs_batch(batch.ids)
+        return FastJSONResponse(TrackBatch(items=songs, missing=missing))
+
+    cursor = mongo.db["songs"].find({"track_id": {"$in": batch.ids}})
+    songs, missing = order_by_ids([doc async for doc in cursor], batch.ids, "track_id")
+    return FastJSONResponse(TrackBatch(items=[DBTrack(**song) for song in songs], missing=missing))
+
+
+async def locate_file(bot: Bot, track: dict) -> Tuple[Bot, FileId]:
+    """
+    File of a track, asking the main bot when `bot` can't get the message.
+    A track is only trashed once the main bot, which indexed it, can't get it either and
+    another bot agrees or it has been missing for `MISSING_CONFIRM_AFTER`.
+    """
+    chat_id, msg_id = track["chat_id"], track["msg_id"]
+    try:
+        return bot, await bot.bytestreamer.get_file_properties(chat_id, msg_id)
+    except FileNotFound:
+        pass
+
+    main_bot = botmanager.get_main_bot()
+    confirmed = False
+    if main_bot and main_bot is not bot and main_bot.is_running:
+        try:
+            return main_bot, await main_bot.bytestreamer.get_file_properties(chat_id, msg_id)
+        except FileNotFound:
+            confirmed = True
+
+    now = time.monotonic()
+    first_missing = _first_missing.get((chat_id, msg_id))
+    if first_missing is None:
+        _first_missing.set((chat_id, msg_id), now)
+        first_missing = now
+
+    if confirmed or now - first_missing >= MISSING_CONFIRM_AFTER:
+        _first_missing.pop((chat_id, msg_id))
+        await TrashManager.move_track(track, "Source message deleted")
+        artist_summaries.mark_stale(track.get("artist_id"))
+    raise HTTPException(status_code=404, detail="Track is no longer available")
 
 
 @router.get("/stream/{file_unique_id}")
@@ -39,7 +107,7 @@ async def stream_song(file_unique_id: str, request: Request, metadata_fetch: boo
     if not bot or not bot.bytestreamer:
         raise HTTPException(status_code=503, detail="Streaming bot unavailable")
 
-    file_id = await bot.bytestreamer.get_file_properties(db_track.chat_id, db_track.msg_id)
+    bot, file_id = await locate_file(bot, track)
     file_size = file_id.file_size or db_track.file_size or 10 * 1024 * 1024
 
     if metadata_fetch:
@@ -107,6 +175,11 @@ async def stream_song(file_unique_id: str, request: Request, metadata_fetch: boo
         else:
             status_code = 200
 
+        # count a play only when playback starts from the beginning, not for HEADs or probes
+        if request.method == "GET" and start_byte == 0 and (not range_header or total_bytes > PLAY_PROBE_BYTES):
+            await mongo.db["songs"].update_one({"_id": track["_id"]}, {"$inc": {"play_count": 1}})
+            artist_summaries.mark_stale(db_track.artist_id)
+
     return StreamingResponse(
         stream_gen,
         status_code=status_code,
@@ -0,0 +1,106 @@
+import json
+import base64
+import binascii
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query
+
+from ...database.connection import mongo
+from ...database.models import DBAlbum, DBArtist, DBTrack
+from ...database.writer import COMMIT_LAG
+from ...utils.web import FastJSONResponse
+from ..models import SyncResponse
+
+router = APIRouter()
+
+# collection -> field its changes are ordered by
+WATERMARK_FIELDS = {
+    "songs": "updated_at",
+    "albums": "updated_at",
+    "artists": "updated_at",
+    "trash": "moved_at",
+}
+
+# (timestamp, _id) of the last document sent, and whether the client had caught up with it
+Mark = Tuple[datetime, ObjectId, bool]
+
+
+def decode_checkpoint(checkpoint: Optional[str]) -> Dict[str, Mark]:
+    if not checkpoint:
+        return {}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(checkpoint.encode()))
+        return {
+            name: (datetime.fromisoformat(mark[0]), ObjectId(mark[1]), bool(mark[2]) if len(mark) > 2 else False)
+            for name, mark in data.items() if name in WATERMARK_FIELDS
+        }
+    except (ValueError, TypeError, IndexError, AttributeError, binascii.Error, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid checkpoint")
+
+
+def encode_checkpoint(marks: Dict[str, Mark]) -> str:
+    data = {name: [ts.isoformat(), str(_id), caught_up] for name, (ts, _id, caught_up) in marks.items()}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+async def fetch_changes(name: str, mark: Optional[Mark], limit: int, query: dict = None) -> List[dict]:
+    """
+    Documents changed after the (timestamp, _id) watermark, oldest first.
+    Once caught up, the last `COMMIT_LAG` is read again: timestamps are taken before the write
+    commits, so a late commit can land behind the watermark. Clients apply changes by `_id`.
+    """
+    field = WATERMARK_FIELDS[name]
+    query = dict(query or {})
+    if mark:
+        ts, _id, caught_up = mark
+        if caught_up:
+            query[field] = {"$gte": ts - COMMIT_LAG}
+        else:
+            query["$or"] = [{field: {"$gt": ts}}, {field: ts, "_id": {"$gt": _id}}]
+    else:
+        query[field] = {"$ne": None}
+
+    # one extra to know if another batch follows
+    cursor = mongo.db[name].find(query).sort([(field, 1), ("_id", 1)]).limit(limit + 1)
+    return [doc async for doc in cursor]
+
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync_library(checkpoint: Optional[str] = None, limit: int = Query(500, ge=1, le=1000)):
+    """
+    Changes since `checkpoint` (omit it for a full sync).
+    Keep calling with the returned checkpoint while `has_more` is true.
+    """
+    marks = decode_checkpoint(checkpoint)
+    has_more = False
+    changes = {}
+
+    for name in WATERMARK_FIELDS:
+        query = {"status": "pending"} if name == "trash" else None
+        mark = marks.get(name)
+        docs = await fetch_changes(name, mark, limit, query)
+        caught_up = len(docs) <= limit
+        if not caught_up:
+            has_more = True
+            docs = docs[:limit]
+
+        position = (docs[-1][WATERMARK_FIELDS[name]], docs[-1]["_id"]) if docs else None
+        if mark and (not position or (caught_up and position < mark[:2])):
+            # nothing newer than what the client has, the look back only repeated older changes
+            position = mark[:2]
+        if position:
+            marks[name] = (*position, caught_up)
+        changes[name] = docs
+
+    response = SyncResponse(
+        tracks=[DBTrack(**doc) for doc in changes["songs"]],
+        albums=[DBAlbum(**doc) for doc in changes["albums"]],
+        artists=[DBArtist(**doc) for doc in changes["artists"]],
+        trashed=[str(doc["original_song_data"]["_id"]) for doc in changes["trash"]],
+        checkpoint=encode_checkpoint(marks),
+        has_more=has_more
+    )
+    return FastJSONResponse(response)
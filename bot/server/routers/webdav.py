@@ -3,16 +3,23 @@ import secrets
 import mimetypes
 import os
 import html
+import gzip
+import time
+import asyncio
+import hashlib
+from datetime import datetime
 from email.utils import formatdate
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import quote, unquote
 
 from fastapi import APIRouter, Request, Response, HTTPException, Depends, status
-from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 
 from config import Config
 from ...database.connection import mongo
 from ...database.models import DBTrack
+from ...database.catalogue import catalogue
+from ...database.writer import COMMIT_LAG
 from .songs import stream_song
 from ...logger import LOGGER
 
@@ -21,6 +28,11 @@ security = HTTPBasic()
 
 # Relaxed regex: Matches "Anything [ID].ext"
 FILENAME_REGEX = re.compile(r"(.+) \[(.+)\]\.(\w+)$")
+UNSAFE_CHARS_REGEX = re.compile(r'[\\/*?:"<>|]')
+# Matches folder names "Anything [ID]"
+FOLDER_REGEX = re.compile(r"(.*) \[([^\[\]]+)\]$")
+
+ROOT_FOLDERS = ("All Songs", "Artists", "Albums")
 
 def check_auth(credentials: HTTPBasicCredentials = Depends(security)):
     if not Config.ENABLE_WEBDAV:
@@ -89,6 +101,10 @@ def generate_xml_block(res: dict, base_url: str):
         # ETag must be quoted
         xml_lines.append(f'<D:getetag>"{res["etag"]}"</D:getetag>')
 
+    if 'ctag' in res and res['ctag']:
+        # Collection tag, changes whenever a child changes
+        xml_lines.append(f'<CS:getctag xmlns:CS="http://calendarserver.org/ns/">{res["ctag"]}</CS:getctag>')
+
     xml_lines.append('</D:prop>')
     xml_lines.append('<D:status>HTTP/1.1 200 OK</D:status>')
     xml_lines.append('</D:propstat>')
@@ -112,6 +128,272 @@ def generate_propfind_xml(resources: list, base_url: str, is_collection: bool =
     xml_lines.append('</D:multistatus>')
     return "\n".join(xml_lines)
 
+async def iter_listed_songs():
+    """Songs shown in the WebDAV listing"""
+    if catalogue.ready:
+        for song in catalogue.iter_songs():
+            if song.file_size is not None:
+                yield song
+        return
+
+    cursor = mongo.db["songs"].find({"file_size": {"$ne": None}})
+    async for song_doc in cursor:
+        yield DBTrack(**song_doc)
+
+
+async def get_song_by_file(file_unique_id: str):
+    if catalogue.ready:
+        return catalogue.get_song_by_file(file_unique_id)
+    song_doc = await mongo.db["songs"].find_one({"file_unique_id": file_unique_id})
+    return DBTrack(**song_doc) if song_doc else None
+
+
+def song_filename(song: DBTrack) -> str:
+    safe_title = UNSAFE_CHARS_REGEX.sub("", song.title).strip()
+    safe_artist = UNSAFE_CHARS_REGEX.sub("", song.artist or "Unknown").strip()
+
+    # Determine extension
+    ext = ".mp3"
+    if song.file_name:
+        _, ext_val = os.path.splitext(song.file_name)
+        if ext_val:
+            ext = ext_val
+    elif song.mime_type:
+        guess = mimetypes.guess_extension(song.mime_type)
+        if guess:
+            ext = guess
+
+    return f"{safe_title} - {safe_artist} [{song.file_unique_id}]{ext}"
+
+
+def song_resource(song: DBTrack, name: str) -> dict:
+    return {
+        'name': name,
+        'is_dir': False,
+        'size': song.file_size,
+        'mimetype': song.mime_type,
+        'created_at': song.created_at,
+        'last_modified': song.updated_at,
+        'etag': song.file_unique_id
+    }
+
+
+def song_headers(song: DBTrack) -> dict:
+    """Entity headers of a file, as a GET would send them"""
+    return {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(song.file_size),
+        "ETag": f'"{song.file_unique_id}"',
+        "Last-Modified": formatdate(timeval=song.updated_at.timestamp(), localtime=False, usegmt=True)
+    }
+
+
+def folder_name(name: Optional[str], _id: str) -> str:
+    # the id keeps the path stable and unique even when names repeat
+    return f"{UNSAFE_CHARS_REGEX.sub('', name or '').strip() or _id} [{_id}]"
+
+
+def folder_resource(name: str, last_modified: Optional[datetime] = None) -> dict:
+    return {'name': name, 'is_dir': True, 'last_modified': last_modified}
+
+
+def album_folders(albums: List[dict]) -> List[dict]:
+    return [folder_resource(folder_name(album.get("title"), album["album_id"]), album.get("updated_at")) for album in albums if album.get("album_id")]
+
+
+def artist_folders(artists: List[dict]) -> List[dict]:
+    return [folder_resource(folder_name(artist.get("name"), artist["artist_id"]), artist.get("updated_at")) for artist in artists if artist.get("artist_id")]
+
+
+def song_files(songs: List[DBTrack]) -> List[dict]:
+    return [song_resource(song, song_filename(song)) for song in songs if song.file_unique_id and song.file_size is not None]
+
+
+def list_catalogue_folder(parts: List[str], ids: List[str], children: bool) -> Optional[List[dict]]:
+    """`list_folder` served from the in-memory catalogue"""
+    def by_name(docs: List[dict], field: str) -> List[dict]:
+        return sorted(docs, key=lambda doc: doc.get(field) or "")
+
+    if not ids:
+        if not children:
+            return []
+        if parts[0] == "Artists":
+            return artist_folders(by_name([artist.model_dump() for artist in catalogue.iter_artists()], "name"))
+        return album_folders(by_name([album.model_dump() for album in catalogue.iter_albums()], "title"))
+
+    if parts[0] == "Artists" and len(ids) == 1:
+        if not catalogue.get_artist(ids[0]):
+            return None
+        albums = [album.model_dump() for album in catalogue.get_artist_albums(ids[0])]
+        return album_folders(by_name(albums, "title")) if children else []
+
+    album = catalogue.get_album(ids[-1])
+    if not album or (parts[0] == "Artists" and album.artist_id != ids[0]):
+        return None
+    if not children:
+        return []
+    songs = sorted(catalogue.get_album_tracks(ids[-1]), key=lambda song: song.track_no or 0)
+    return song_files(songs)
+
+
+async def list_folder(parts: List[str], children: bool = True) -> Optional[List[dict]]:
+    """
+    Resources inside a folder of the Artists / Albums trees, each level is one indexed query
+    or a catalogue lookup when the catalogue is loaded.
+
+    Args:
+        parts: Path segments, starting with "Artists" or "Albums"
+        children: Only check that the folder exists when False (Depth: 0)
+    Returns:
+        None if the folder does not exist
+    """
+    matches = [FOLDER_REGEX.match(part) for part in parts[1:]]
+    if not all(matches):
+        return None
+    ids = [match.group(2) for match in matches]
+    if len(ids) > (2 if parts[0] == "Artists" else 1):
+        return None
+
+    if catalogue.ready:
+        return list_catalogue_folder(parts, ids, children)
+
+    if not ids:
+        if not children:
+            return []
+        if parts[0] == "Artists":
+            cursor = mongo.db["artists"].find(
+                {"artist_id": {"$ne": None}}, {"name": 1, "artist_id": 1, "updated_at": 1}
+            ).sort("name", 1)
+            return artist_folders([doc async for doc in cursor])
+        cursor = mongo.db["albums"].find({}, {"title": 1, "album_id": 1, "updated_at": 1}).sort("title", 1)
+        return album_folders([doc async for doc in cursor])
+
+    # Artists/<artist>
+    if parts[0] == "Artists" and len(ids) == 1:
+        if not await mongo.db["artists"].find_one({"artist_id": ids[0]}, {"_id": 1}):
+            return None
+        if not children:
+            return []
+        cursor = mongo.db["albums"].find(
+            {"artist_id": ids[0]}, {"title": 1, "album_id": 1, "updated_at": 1}
+        ).sort("title", 1)
+        return album_folders([doc async for doc in cursor])
+
+    # Artists/<artist>/<album> and Albums/<album>
+    query = {"album_id": ids[-1]}
+    if parts[0] == "Artists":
+        query["artist_id"] = ids[0]
+    if not await mongo.db["albums"].find_one(query, {"_id": 1}):
+        return None
+    if not children:
+        return []
+    cursor = mongo.db["songs"].find({"album_id": ids[-1], "file_size": {"$ne": None}}).sort("track_no", 1)
+    return song_files([DBTrack(**song_doc) async for song_doc in cursor])
+
+
+class SongListing:
+    def __init__(self, refresh_interval: float = 5.0, max_bases: int = 4):
+        """
+        Materialised multistatus document of "All Songs".
+        Per track blocks are rendered once, with hrefs relative to the collection, and patched
+        when tracks are added, updated or trashed. The full document is rendered plain and
+        gzipped for each base URL it is requested under (LAN and public hostnames...).
+
+        Args:
+            refresh_interval: Min seconds between checks for changed tracks
+            max_bases: Rendered documents kept, one per base URL
+        """
+        self.refresh_interval = refresh_interval
+        self.max_bases = max_bases
+        self.blocks: Dict[str, str] = {}  # file_unique_id -> <D:response> block
+        self.ctag: Optional[str] = None  # None until the first build
+        self._rendered: Dict[str, Tuple[bytes, bytes]] = {}  # base_url -> (body, gzipped body)
+
+        self._watermark: Optional[datetime] = None
+        self._trash_watermark: Optional[datetime] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, base_url: str) -> Tuple[str, bytes, bytes]:
+        """
+        Returns:
+            ctag, body and gzipped body of the listing under `base_url`
+        """
+        async with self._lock:
+            if self.ctag is None:
+                await self._build()
+            elif time.monotonic() - self._checked_at >= self.refresh_interval:
+                await self._update()
+            if base_url not in self._rendered:
+                await self._render(base_url)
+            body, gzipped = self._rendered[base_url]
+            return self.ctag, body, gzipped
+
+    async def _build(self):
+        self.blocks = {}
+        self._watermark = self._trash_watermark = datetime.utcnow()
+        async for song in iter_listed_songs():
+            self._put(song)
+        self._changed()
+        self._checked_at = time.monotonic()
+
+    async def _update(self):
+        changed = False
+
+        cursor = mongo.db["songs"].find({"updated_at": {"$gte": self._watermark - COMMIT_LAG}, "file_size": {"$ne": None}})
+        async for song_doc in cursor:
+            song = DBTrack(**song_doc)
+            changed = self._put(song) or changed
+            self._watermark = max(self._watermark, song.updated_at)
+
+        cursor = mongo.db["trash"].find(
+            {"moved_at": {"$gte": self._trash_watermark - COMMIT_LAG}, "status": "pending"},
+            {"original_song_data.file_unique_id": 1, "moved_at": 1}
+        )
+        async for trash_doc in cursor:
+            removed = self.blocks.pop(trash_doc["original_song_data"].get("file_unique_id"), None)
+            changed = changed or removed is not None
+            self._trash_watermark = max(self._trash_watermark, trash_doc["moved_at"])
+
+        if changed:
+            self._changed()
+        self._checked_at = time.monotonic()
+
+    def _put(self, song: DBTrack) -> bool:
+        # Ensure we have a unique ID for the filename
+        if not song.file_unique_id:
+            return False
+        block = generate_xml_block(song_resource(song, song_filename(song)), "")
+        if self.blocks.get(song.file_unique_id) == block:
+            return False
+        self.blocks[song.file_unique_id] = block
+        return True
+
+    def _changed(self):
+        self.ctag = hashlib.sha1("\n".join(self.blocks.values()).encode()).hexdigest()
+        self._rendered = {}
+
+    async def _render(self, base_url: str):
+        href = f"<D:href>{base_url}"
+        content = "\n".join(block.replace("<D:href>", href, 1) for block in self.blocks.values())
+        self_block = generate_xml_block({'name': '', 'is_dir': True, 'ctag': self.ctag}, base_url)
+        body = "\n".join([
+            '<?xml version="1.0" encoding="utf-8" ?>',
+            '<D:multistatus xmlns:D="DAV:">',
+            self_block,
+            content,
+            '</D:multistatus>'
+        ]).encode()
+        # compressing a large library takes a while, keep it off the event loop
+        gzipped = await asyncio.to_thread(gzip.compress, body, 6)
+        if len(self._rendered) >= self.max_bases:
+            self._rendered.pop(next(iter(self._rendered)))
+        self._rendered[base_url] = (body, gzipped)
+
+
+song_listing = SongListing()
+
+
 @router.api_route("/webdav/{path:path}", methods=["GET", "HEAD", "PROPFIND", "OPTIONS"])
 async def webdav_handler(path: str, request: Request, username: str = Depends(check_auth)):
     path = unquote(path)
@@ -138,126 +420,84 @@ async def webdav_handler(path: str, request: Request, username: str = Depends(ch
             "MS-Author-Via": "DAV"
         })
 
+    parts = clean_path.split('/') if clean_path else []
+    # Files resolve by the id in their name, the same file has the same name in every folder
+    file_match = FILENAME_REGEX.match(parts[-1]) if parts and parts[0] in ROOT_FOLDERS else None
+
     if method == "PROPFIND":
+        # Depth: infinity would walk the whole library, it is answered like 1
         depth = request.headers.get("Depth", "1")
-        
+
+        if file_match:
+            song = await get_song_by_file(file_match.group(2))
+            if song:
+                resources = [song_resource(song, '')] # Self
+                xml_content = generate_propfind_xml(resources, resource_url, is_collection=False)
+                return Response(content=xml_content, media_type="application/xml; charset=utf-8", status_code=207)
+
         # Root Listing
-        if clean_path == "":
+        elif clean_path == "":
              resources = [
                  {'name': '', 'is_dir': True} # Self
              ]
              if depth != '0':
                  # Children
-                 resources.append({'name': 'All Songs', 'is_dir': True})
-                 
+                 resources.extend(folder_resource(name) for name in ROOT_FOLDERS)
+
              xml_content = generate_propfind_xml(resources, base_url, is_collection=True)
              return Response(content=xml_content, media_type="application/xml; charset=utf-8", status_code=207)
-        
-        elif clean_path == "All Songs":
-             async def stream_all_songs(base_url_str: str):
-                 yield '<?xml version="1.0" encoding="utf-8" ?>\n'
-                 yield '<D:multistatus xmlns:D="DAV:">\n'
-                 
-                 # Adjust base_url for collection
-                 if not base_url_str.endswith('/'):
-                     base_url_str += '/'
-                     
-                 # Yield Self
-                 self_res = {'name': '', 'is_dir': True}
-                 yield generate_xml_block(self_res, base_url_str)
-                 
-                 # Stream Songs
-                 cursor = mongo.db["songs"].find({"file_size": {"$ne": None}})
-                 async for song_doc in cursor:
-                     song = DBTrack(**song_doc)
-                     # Ensure we have a unique ID for the filename
-                     if not song.file_unique_id:
-                          continue
-                          
-                     safe_title = re.sub(r'[\\/*?:"<>|]', "", song.title).strip()
-                     safe_artist = re.sub(r'[\\/*?:"<>|]', "", song.artist or "Unknown").strip()
-                     
-                     # Determine extension
-                     ext = ".mp3"
-                     if song.file_name:
-                          _, ext_val = os.path.splitext(song.file_name)
-                          if ext_val:
-                              ext = ext_val
-                     elif song.mime_type:
-                          guess = mimetypes.guess_extension(song.mime_type)
-                          if guess:
-                              ext = guess
-                              
-                     name = f"{safe_title} - {safe_artist} [{song.file_unique_id}]{ext}"
-                     
-                     res = {
-                         'name': name,
-                         'is_dir': False,
-                         'size': song.file_size,
-                         'mimetype': song.mime_type,
-                         'created_at': song.created_at,
-                         'last_modified': song.updated_at,
-                         'etag': song.file_unique_id
-                     }
-                     yield generate_xml_block(res, base_url_str)
-                     
-                 yield '</D:multistatus>'
 
+        elif clean_path == "All Songs":
              if depth == '0':
-                  # Just self
-                  resources = [{'name': '', 'is_dir': True}]
+                  # Just self, the ctag is only known once the listing has been built
+                  resources = [{'name': '', 'is_dir': True, 'ctag': song_listing.ctag}]
                   xml_content = generate_propfind_xml(resources, resource_url, is_collection=True)
                   return Response(content=xml_content, media_type="application/xml; charset=utf-8", status_code=207)
-             
-             return StreamingResponse(stream_all_songs(resource_url), media_type="application/xml; charset=utf-8", status_code=207)
-        
-        else:
-            # Check if it matches a file in "All Songs"
-            # clean_path "All Songs/Title..."
-            parts = clean_path.split('/')
-            if len(parts) == 2 and parts[0] == "All Songs":
-                filename = parts[1]
-                match = FILENAME_REGEX.match(filename)
-                if match:
-                    file_unique_id = match.group(2)
-                    song_doc = await mongo.db["songs"].find_one({"file_unique_id": file_unique_id})
-                    if song_doc:
-                        song = DBTrack(**song_doc)
-                        resources = [{
-                             'name': '', # Self
-                             'is_dir': False,
-                             'size': song.file_size,
-                             'mimetype': song.mime_type,
-                             'created_at': song.created_at,
-                             'last_modified': song.updated_at,
-                             'etag': song.file_unique_id
-                        }]
-                        xml_content = generate_propfind_xml(resources, resource_url, is_collection=False)
-                        return Response(content=xml_content, media_type="application/xml; charset=utf-8", status_code=207)
-
-            raise HTTPException(status_code=404, detail="Not Found")
+
+             ctag, body, gzipped = await song_listing.get(resource_url + '/')
+             etag = f'"{ctag}"'
+             headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+
+             if_none_match = request.headers.get("If-None-Match", "")
+             if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+                  return Response(status_code=304, headers=headers)
+
+             if "gzip" in request.headers.get("Accept-Encoding", ""):
+                  headers["Content-Encoding"] = "gzip"
+                  return Response(content=gzipped, media_type="application/xml; charset=utf-8", status_code=207, headers=headers)
+             return Response(content=body, media_type="application/xml; charset=utf-8", status_code=207, headers=headers)
+
+        elif parts[0] in ("Artists", "Albums"):
+            children = await list_folder(parts, children=depth != '0')
+            if children is not None:
+                resources = [{'name': '', 'is_dir': True}] + children
+                xml_content = generate_propfind_xml(resources, resource_url, is_collection=True)
+                return Response(content=xml_content, media_type="application/xml; charset=utf-8", status_code=207)
+
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    if method == "HEAD" and file_match:
+        # Stored metadata is enough, bots are left for actual transfers
+        song = await get_song_by_file(file_match.group(2))
+        if not song:
+            raise HTTPException(status_code=404, detail="File Not Found")
+        if song.file_size is not None:
+            return Response(headers=song_headers(song), media_type=song.mime_type or "audio/mpeg")
 
     if method == "GET" or method == "HEAD":
+        if file_match:
+            file_unique_id = file_match.group(2)
+            try:
+                # If this is a GET request without a Range header, it's likely a metadata fetch.
+                is_metadata_fetch = (method == "GET") and (request.headers.get("Range") is None)
+                return await stream_song(file_unique_id, request, metadata_fetch=is_metadata_fetch)
+            except HTTPException as e:
+                LOGGER.error(f"Stream Error: {e.detail}")
+                raise e
+
         # Handle collections
-        if clean_path == "" or clean_path == "All Songs":
+        if clean_path == "" or (parts[0] in ROOT_FOLDERS and all(FOLDER_REGEX.match(part) for part in parts[1:])):
              return Response(content="WebDAV Collection", media_type="text/plain")
 
-        parts = clean_path.split('/')
-        if len(parts) == 2 and parts[0] == "All Songs":
-            filename = parts[1]
-            match = FILENAME_REGEX.match(filename)
-            if match:
-                file_unique_id = match.group(2)
-                try:
-                    # If this is a GET request without a Range header, it's likely a metadata fetch.
-                    is_metadata_fetch = (method == "GET") and (request.headers.get("Range") is None)
-                    return await stream_song(file_unique_id, request, metadata_fetch=is_metadata_fetch)
-                except HTTPException as e:
-                    LOGGER.error(f"Stream Error: {e.detail}")
-                    raise e
-            else:
-                LOGGER.warning(f"WebDAV Filename mismatch: {filename}")
-        else:
-            LOGGER.warning(f"WebDAV Invalid Path Structure: {clean_path} ->Parts: {parts}")
-        
+        LOGGER.warning(f"WebDAV Invalid Path Structure: {clean_path} ->Parts: {parts}")
         raise HTTPException(status_code=404, detail="File Not Found")
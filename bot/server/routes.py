@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from .routers import auth, songs, artists, albums, search, webdav
+from .routers import auth, songs, artists, albums, search, playlists, sync, webdav
 
 router = APIRouter()
 
@@ -9,4 +9,6 @@ router.include_router(songs.router, tags=["Songs"])
 router.include_router(artists.router, tags=["Artists"])
 router.include_router(albums.router, tags=["Albums"])
 router.include_router(search.router, tags=["Search"])
+router.include_router(playlists.router, tags=["Playlists"])
+router.include_router(sync.router, tags=["Sync"])
 router.include_router(webdav.router, tags=["WebDAV"])
\ No newline at end of file
@@ -231,6 +231,11 @@ class BotManager:
         """Get the main bot"""
         return self._main_bot
 
+
+    def get_bot_by_client(self, client: Client) -> Optional[Bot]:
+        """Get the bot running `client`"""
+        return next((bot for bot in self._bots.values() if bot._client is client), None)
+
     
     def get_available_bot(self) -> Optional[Bot]:
         """Get an available worker bot with least workload"""
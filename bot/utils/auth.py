@@ -1,15 +1,25 @@
+import time
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer
-from typing import Optional
+from typing import Any, Callable, Dict, Optional
 from ..database.connection import mongo
+from .cache import TTLCache
 
 from config import Config
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# decoded payloads per token, kept until the token expires
+_token_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+# user documents keyed by (username, token issue time)
+_user_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+
 # hybrid approach for JWT in cookie
 class CookieBearer(HTTPBearer):
     async def __call__(self, request: Request) -> Optional[str]:
@@ -31,20 +41,74 @@ class CookieBearer(HTTPBearer):
 oauth2_scheme = CookieBearer()
 
 
-def verify_password(plain_password, hashed):
-    return pwd_context.verify(plain_password, hashed)
+class PasswordHasher:
+    def __init__(self, workers: int, queue_limit: int):
+        """
+        Runs bcrypt on a dedicated thread pool so it never blocks the event loop
+        (bcrypt releases the GIL while hashing).
+
+        Args:
+            workers: No. of hashes computed concurrently
+            queue_limit: Max jobs waiting or running before new ones are rejected
+        """
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, try again")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "running": min(self.pending, self.workers),
+            "queued": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
 
-def hash_password(password):
-    return pwd_context.hash(password)
+
+hasher = PasswordHasher(Config.HASH_WORKERS, Config.HASH_QUEUE_LIMIT)
+
+
+async def verify_password(plain_password, hashed):
+    return await hasher.run(pwd_context.verify, plain_password, hashed)
+
+async def hash_password(password):
+    return await hasher.run(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=Config.ACCESS_TOKEN_EXPIRE))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     return jwt.encode(to_encode, Config.SECRET_KEY, algorithm=Config.SECRET_ALGORITHM)
 
 def decode_access_token(token: str):
-    return jwt.decode(token, Config.SECRET_KEY, algorithms=[Config.SECRET_ALGORITHM])
+    payload = _token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, Config.SECRET_KEY, algorithms=[Config.SECRET_ALGORITHM])
+        expiry = payload.get("exp")
+        ttl = expiry - time.time() if expiry else Config.USER_CACHE_TTL
+        _token_cache.set(token, payload, ttl=max(ttl, 0))
+    return payload
+
+
+def invalidate_user(username: str):
+    """Drop cached lookups of a user, call this whenever the user document changes"""
+    _user_cache.pop_where(lambda key: key[0] == username)
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -53,9 +117,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         username = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await mongo.db["users"].find_one({"username": username})
+        cache_key = (username, payload.get("iat"))
+        user = _user_cache.get(cache_key)
         if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
+            user = await mongo.db["users"].find_one({"username": username})
+            if user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            _user_cache.set(cache_key, user)
         return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
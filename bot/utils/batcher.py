@@ -0,0 +1,79 @@
+import asyncio
+
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from .cache import TTLCache
+
+
+_MISSING = object()
+
+
+class BatchLoader:
+    def __init__(self, fetch: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]], max_batch: int = 50, window: float = 0.01):
+        """
+        Coalesces single key loads made within `window` into one `fetch` call.
+        The same key requested twice in a batch is only fetched once.
+
+        Args:
+            fetch: Loads many keys at once, returns the values found by key.
+                An exception as a value fails the loads of only that key
+            max_batch: Max keys per `fetch` call
+            window: Seconds to wait for more keys before fetching
+        """
+        self.fetch = fetch
+        self.max_batch = max_batch
+        self.window = window
+
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # values that came along with another response, used once
+        self._primed = TTLCache(maxsize=2048, ttl=600)
+
+    def prime(self, key: Hashable, value: Any):
+        self._primed.set(key, value)
+
+    async def load(self, key: Hashable) -> Any:
+        """Value for `key`, None when `fetch` did not return it"""
+        value = self._primed.get(key, _MISSING)
+        if value is not _MISSING:
+            self._primed.pop(key)
+            return value
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif not self._timer:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[Hashable, List[asyncio.Future]]):
+        try:
+            values = await self.fetch(list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for key, futures in batch.items():
+            value = values.get(key)
+            for future in futures:
+                if future.done():
+                    continue
+                if isinstance(value, Exception):
+                    future.set_exception(value)
+                else:
+                    future.set_result(value)
@@ -0,0 +1,94 @@
+import time
+import asyncio
+
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+from .errors import CircuitOpen
+from bot.logger import LOGGER
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+        timeout: Optional[float] = None,
+        excluded: Tuple[Type[Exception], ...] = (),
+        on_recover: Optional[Callable[[], Any]] = None
+    ):
+        """
+        Fails calls right away while a dependency keeps failing.
+        After `failure_threshold` failures in a row the circuit opens, after `reset_timeout`
+        a single trial call is let through and closes it again if it succeeds.
+        Outcomes are recorded per request with `track`, `allow` only gates new calls.
+
+        Args:
+            name: Shown in logs
+            timeout: Seconds before a call counts as failed
+            excluded: Exceptions that are normal answers, not failures
+            on_recover: Called when the circuit closes after being open
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timeout = timeout
+        self.excluded = excluded
+        self.on_recover = on_recover
+
+        self.state = "closed"  # closed, open, half-open
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        # open for `reset_timeout`, or half-open that long because the trial made no request
+        if time.monotonic() >= self.opened_at + self.reset_timeout:
+            self.state = "half-open"
+            self.opened_at = time.monotonic()
+            return True
+        # open, or the trial call is still running
+        return False
+
+    def success(self):
+        recovered = self.state != "closed"
+        self.state = "closed"
+        self.failures = 0
+        if recovered:
+            LOGGER.info(f"CircuitBreaker : {self.name} recovered")
+            if self.on_recover:
+                self.on_recover()
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                LOGGER.warning(f"CircuitBreaker : {self.name} is failing, pausing calls for {self.reset_timeout}s")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    @asynccontextmanager
+    async def track(self):
+        """Record the outcome of one request to the dependency"""
+        try:
+            yield
+        except self.excluded:
+            self.success()
+            raise
+        except Exception:
+            self.failure()
+            raise
+        except asyncio.CancelledError:
+            # a cancelled trial request must not leave the circuit half-open
+            if self.state == "half-open":
+                self.opened_at = time.monotonic() - self.reset_timeout
+            raise
+        self.success()
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is unavailable")
+        async with self.track():
+            return await asyncio.wait_for(func(), self.timeout)
@@ -4,5 +4,12 @@ class SpotifyError(Exception):
 class AppleMusicError(Exception):
     pass
 
+class MetadataNotFound(Exception):
+    """The provider has no result, safe to cache unlike other provider errors"""
+    pass
+
+class CircuitOpen(Exception):
+    pass
+
 class FileNotFound(Exception):
     pass
\ No newline at end of file
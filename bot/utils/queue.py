@@ -1,47 +1,109 @@
+import time
 import asyncio
-from typing import Callable, Awaitable, Any
+
+from contextlib import contextmanager
+from typing import Callable, Awaitable, Any, Dict, Iterator, List, Optional
+
+from bot.logger import LOGGER
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens added per second, 0 disables the limit
+            capacity: Max burst size (default: one second worth of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until `tokens` are available, callers are served in order"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
 
 class AsyncQueueProcessor:
-    def __init__(self, handler: Callable[[Any], Awaitable[None]], rate_limit: float = 10.0):
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], concurrency: int = 1, max_size: int = 0):
         """
         Args:
             handler: The async function to process each item
-            rate_limit: Maximum items per second (default 10)
+            concurrency: No. of items processed at the same time
+            max_size: Max items waiting, `add_item` blocks while the queue is full (0 for unbounded)
         """
-        self.queue = asyncio.Queue()
+        self.queue = asyncio.Queue(maxsize=max_size)
         self.handler = handler
-        self.processing_task = None
-        self.rate_limit = rate_limit
-        self.delay = 1.0 / rate_limit if rate_limit > 0 else 0
+        self.concurrency = concurrency
+        self.workers: List[asyncio.Task] = []
+
+        self.processed = 0
+        self.failed = 0
+        self.timings: Dict[str, List[float]] = {}  # stage -> [count, total seconds]
 
     def start(self):
-        if not self.processing_task or self.processing_task.done():
-            self.processing_task = asyncio.create_task(self._process())
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < self.concurrency:
+            self.workers.append(asyncio.create_task(self._process()))
 
     async def _process(self):
         while True:
             item = await self.queue.get()
             if item is None:
+                self.queue.task_done()
                 break  # stop signal
-            try:
-                await self.handler(item)
-            except Exception as e:
-                print(f"Error processing item: {e}")
+
+            with self.stage("total"):
+                try:
+                    await self.handler(item)
+                    self.processed += 1
+                except Exception as e:
+                    self.failed += 1
+                    LOGGER.error(f"Queue : Error processing item - {e}")
             self.queue.task_done()
-            
-            # Rate limiting delay
-            if self.delay > 0:
-                await asyncio.sleep(self.delay)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a step of the handler, shown in `stats`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing = self.timings.setdefault(name, [0, 0.0])
+            timing[0] += 1
+            timing[1] += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "workers": self.concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            # average milliseconds per stage
+            "stages": {name: total / count * 1000 for name, (count, total) in self.timings.items()}
+        }
 
     async def add_item(self, item: Any):
-        await self.queue.put(item)
         self.start()
+        await self.queue.put(item)
 
     async def add_items(self, items: list[Any]):
         for item in items:
             await self.add_item(item)
 
     async def stop(self):
-        await self.queue.put(None)
-        if self.processing_task:
-            await self.processing_task
+        for _ in self.workers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.workers)
+        self.workers = []
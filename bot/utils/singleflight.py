@@ -0,0 +1,34 @@
+import asyncio
+
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        """Runs work once per key at a time, concurrent callers for the same key wait for that run"""
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._in_flight
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `func`, or of the run already in progress for `key`"""
+        if key in self._in_flight:
+            # a cancelled waiter must not cancel the run for the others
+            return await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await func()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # mark it retrieved, there may be nobody waiting
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+            if not future.done():
+                future.cancel()
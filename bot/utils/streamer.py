@@ -5,11 +5,17 @@ from pyrogram.file_id import FileId, FileType, ThumbnailSource
 from pyrogram.session import Session, Auth
 from typing import Dict, Union, AsyncGenerator, Optional
 from .errors import FileNotFound
+from .cache import TTLCache
 from pyrogram import Client, utils, raw
 
 from bot.logger import LOGGER
 
 
+# (bot_id, chat_id, message_id) of messages a bot could not get, so its repeat requests skip Telegram.
+# Kept per bot, a worker outside the channel must not hide the message from the others
+dead_messages = TTLCache(maxsize=10000, ttl=10 * 60)
+
+
 def is_media(message):
     return next((getattr(message, attr) for attr in ["document", "photo", "video", "audio", "voice", "video_note", "sticker", "animation"] if getattr(message, attr)), None)
 
@@ -18,10 +24,10 @@ async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optiona
     message = await client.get_messages(chat_id, message_id)
     if message.empty:
         raise FileNotFound
-    file_id = file_unique_id = None
-    if media := is_media(message):
-        file_id, file_unique_id = FileId.decode(
-            media.file_id), media.file_unique_id
+    media = is_media(message)
+    if not media:
+        raise FileNotFound
+    file_id, file_unique_id = FileId.decode(media.file_id), media.file_unique_id
     setattr(file_id, 'file_name', getattr(media, 'file_name', ''))
     setattr(file_id, 'file_size', getattr(media, 'file_size', 0))
     setattr(file_id, 'mime_type', getattr(media, 'mime_type', ''))
@@ -45,8 +51,16 @@ class ByteStreamer:
         if cache_key in self.__file_properties_cache:
             return self.__file_properties_cache[cache_key]
 
+        dead_key = (self.bot.bot_id, chat_id, message_id)
+        if dead_key in dead_messages:
+            raise FileNotFound
+
         if message_id not in self.__cached_file_ids:
-            file_id = await get_file_ids(self.client, int(chat_id), int(message_id))
+            try:
+                file_id = await get_file_ids(self.client, int(chat_id), int(message_id))
+            except FileNotFound:
+                dead_messages.set(dead_key, True)
+                raise
             if not file_id:
                 LOGGER.info('Message with ID %s not found!', message_id)
                 raise FileNotFound
@@ -56,6 +70,16 @@ class ByteStreamer:
         self.__file_properties_cache[cache_key] = file_id
         return file_id
 
+    async def read_head(self, chat_id: int, message_id: int, size: int) -> bytes:
+        """First `size` bytes of a file, fetched in 512 KB parts"""
+        file_id = await self.get_file_properties(chat_id, message_id)
+        chunk_size = 512 * 1024
+        part_count = max(1, -(-size // chunk_size))
+        chunks = [
+            chunk async for chunk in self.yield_file(file_id, 0, 0, 0, chunk_size, part_count, chunk_size)
+        ]
+        return b"".join(chunks)[:size]
+
     async def yield_file(self, file_id: FileId, index: int, offset: int, first_part_cut: int, last_part_cut: int, part_count: int, chunk_size: int) -> AsyncGenerator[bytes, None]:
         client = self.client
         self.bot.increment_workload()
@@ -1,5 +1,15 @@
 import re
-from typing import Dict
+import orjson
+
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+# one adapter per model, building them is expensive
+_list_adapters: Dict[type, TypeAdapter] = {}
 
 
 def paginate(limit: int = 10, page: int = 1) -> Dict[str, int]:
@@ -19,4 +29,68 @@ def parse_range_header(range_header: str, file_size: int):
     end = int(match.group(2)) if match.group(2) else file_size - 1
 
     end = min(end, file_size - 1)
-    return start, end
\ No newline at end of file
+    return start, end
+
+
+def parse_object_ids(ids: Iterable[str]) -> List[ObjectId]:
+    """Convert ids sent by clients, rejecting the request if any is malformed"""
+    object_ids = []
+    for _id in ids:
+        if not ObjectId.is_valid(_id):
+            raise HTTPException(status_code=400, detail=f"Invalid id: {_id}")
+        object_ids.append(ObjectId(_id))
+    return object_ids
+
+
+def order_by_ids(docs: Iterable[dict], ids: List[str], key: str) -> Tuple[List[dict], List[str]]:
+    """
+    Arrange documents fetched with an `$in` query in the requested order.
+    Returns the found documents and the ids that had no match.
+    """
+    found: Dict[Any, dict] = {}
+    for doc in docs:
+        found.setdefault(doc.get(key), doc)
+
+    ordered, missing = [], []
+    for _id in ids:
+        if _id in found:
+            ordered.append(found[_id])
+        else:
+            missing.append(_id)
+    return ordered, missing
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(by_alias=True)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dump_json(content: Any) -> bytes:
+    """
+    Serialise a response straight to bytes.
+    Models (and lists of them) go through pydantic-core directly,
+    everything else through orjson.
+    """
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content, by_alias=True)
+
+    if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+        model = type(content[0])
+        adapter = _list_adapters.get(model)
+        if adapter is None:
+            adapter = _list_adapters[model] = TypeAdapter(List[model])
+        return adapter.dump_json(content, by_alias=True)
+
+    return orjson.dumps(content, default=_json_default)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered by `dump_json`.
+    Returning this from a route also skips FastAPI's re-validation against `response_model`.
+    """
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
@@ -44,6 +44,35 @@ class Config(object):
     SECRET_ALGORITHM = getenv('SECRET_ALGORITHM', "HS256")
     ACCESS_TOKEN_EXPIRE = int(getenv('ACCESS_TOKEN_EXPIRE', 60))
 
+    USER_CACHE_TTL = int(getenv('USER_CACHE_TTL', 60))  # seconds
+    USER_CACHE_SIZE = int(getenv('USER_CACHE_SIZE', 1024))
+
+    HASH_WORKERS = int(getenv('HASH_WORKERS', 2))  # threads used for bcrypt
+    HASH_QUEUE_LIMIT = int(getenv('HASH_QUEUE_LIMIT', 64))  # pending hash jobs before rejecting logins
+
+    BATCH_LIMIT = int(getenv('BATCH_LIMIT', 200))  # max ids per batch lookup
+
+    INDEX_WORKERS = int(getenv('INDEX_WORKERS', 4))  # messages indexed concurrently
+    INDEX_QUEUE_SIZE = int(getenv('INDEX_QUEUE_SIZE', 1000))  # queued messages before /index waits
+    INDEX_FETCHES_PER_BOT = int(getenv('INDEX_FETCHES_PER_BOT', 2))  # concurrent /index chunk fetches per bot
+    METADATA_RATE_LIMIT = float(getenv('METADATA_RATE_LIMIT', 10))  # provider requests per second
+    INDEX_MAX_ATTEMPTS = int(getenv('INDEX_MAX_ATTEMPTS', 5))  # before an indexing job is marked failed
+    READ_FILE_TAGS = getenv('READ_FILE_TAGS', "True").lower() == "true"  # read embedded tags before asking the provider
+
+    METADATA_CACHE_TTL = int(getenv('METADATA_CACHE_TTL', 30 * 24 * 3600))  # seconds
+    METADATA_NEGATIVE_TTL = int(getenv('METADATA_NEGATIVE_TTL', 24 * 3600))  # seconds, for lookups without a result
+    METADATA_TIMEOUT = float(getenv('METADATA_TIMEOUT', 15))  # seconds per provider lookup
+    METADATA_BREAKER_THRESHOLD = int(getenv('METADATA_BREAKER_THRESHOLD', 5))  # failures in a row before pausing the provider
+    METADATA_BREAKER_RESET = float(getenv('METADATA_BREAKER_RESET', 60))  # seconds before trying a paused provider again
+
+    # in-memory catalogue for read endpoints, see bot/database/catalogue.py for memory use
+    CATALOGUE_CACHE = getenv('CATALOGUE_CACHE', "False").lower() == "true"
+    CATALOGUE_MAX_TRACKS = int(getenv('CATALOGUE_MAX_TRACKS', 200000))
+    CATALOGUE_SYNC_INTERVAL = int(getenv('CATALOGUE_SYNC_INTERVAL', 10))  # seconds
+
+    # apply index changes on startup, disable when running `python -m bot.database` separately
+    AUTO_MIGRATE = getenv('AUTO_MIGRATE', "True").lower() == "true"
+
 
     # Do not touch (except for yk what you doin)
     if MULTI_CLIENTS: